@@ -0,0 +1,160 @@
+# imports
+import re
+import time
+import threading
+from bootstrap import lazy_import
+from crawlCache import CrawlCache, content_hash
+from siteIndex import HashingEmbedder
+
+# NumPy is only loaded once the near-duplicate tier is used
+np = lazy_import("numpy")
+
+ANSWER_TTL = 60 * 60          # seconds a cached answer stays fresh
+MAX_NEAR_ENTRIES = 2048       # questions kept in the near-duplicate tier, oldest replaced first
+NEAR_THRESHOLD = 0.85         # cosine similarity a question needs to reuse a cached answer
+
+_word = re.compile(r"\w+")
+
+# Words that change how a question reads without changing what it asks
+FILLER_WORDS = {
+    "a", "an", "the", "is", "are", "was", "be", "do", "does", "did", "can", "could", "would", "will",
+    "i", "me", "my", "we", "you", "your", "please", "thanks", "thank", "hi", "hello", "hey", "so",
+    "what", "whats", "s", "how", "much", "of", "for", "to", "in", "on", "at", "any", "some", "and", "or",
+    "price", "prices", "cost", "costs", "tell", "know", "want", "like", "need",
+}
+
+# Words that point back at earlier turns: a question using them depends on the conversation so far
+REFERRING_WORDS = {
+    "it", "its", "that", "this", "these", "those", "they", "them", "their", "there", "same", "also",
+    "again", "else", "instead", "another", "other", "previous", "above", "one", "ones", "more",
+}
+
+# Words that turn a question around; a near match must have the same ones ("n't" and "cannot" count as "not")
+NEGATION_WORDS = {
+    "not", "no", "never", "without", "nor", "neither", "none", "nothing", "nobody", "nowhere",
+    "but", "except", "unless", "although", "though",
+}
+_negation = re.compile(r"n['’]t\b|\bcannot\b")
+
+def normalize_question(message):
+    return " ".join(_word.findall(message.lower()))
+
+def standalone(message, history):
+    """
+    Whether message can be answered without the conversation so far, so an answer given to someone
+    else can be reused for it.
+    """
+    return not history or not REFERRING_WORDS.intersection(_word.findall(message.lower()))
+
+class AnswerCache:
+    """
+    Caches the answers to standalone questions. An exact tier matches the normalized question; a
+    near-duplicate tier compares offline embeddings of the question's content words, so "How much is a
+    ticket to London?" reuses the answer to "London ticket price, please". A near match also needs the same
+    key terms (e.g. city names), numbers and negations, so the answer for London is never given for Paris,
+    nor the answer to "I want a hat" for "I don't want a hat".
+    """
+
+    def __init__(self, name, version=lambda: None, key_terms=lambda: (), ttl=ANSWER_TTL,
+                 max_near_entries=MAX_NEAR_ENTRIES, threshold=NEAR_THRESHOLD, embedder=None):
+        """
+        Args:
+            name (str): Name of the on-disk exact tier.
+            version: function returning a fingerprint of whatever the answers depend on (e.g. the fare
+                table); when it changes every cached answer is dropped.
+            key_terms: function returning the lowercase words a near match must agree on.
+        """
+        self.exact = CrawlCache(name, ttl=ttl)
+        self.version = version
+        self.key_terms = key_terms
+        self.ttl = ttl
+        self.max_near_entries = max_near_entries
+        self.threshold = threshold
+        self.embedder = embedder or HashingEmbedder(dimensions=512)
+        self.lock = threading.Lock()
+        self.current_version = None
+        self.vectors = None      # max_near_entries x dimensions, filled as a ring
+        self.entries = []        # (prompt key, key-term anchors, expires, answer) per row
+        self.next_row = 0
+        self.stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "bypassed": 0, "invalidations": 0}
+
+    def lookup(self, system_prompt, message, history):
+        """
+        Returns the cached answer to message, or None. Questions that depend on history are never answered
+        from the cache.
+        """
+        if not standalone(message, history):
+            self.stats["bypassed"] += 1
+            return None
+        prompt_key = self._prompt_key(system_prompt)
+        answer = self.exact.get(content_hash(prompt_key, normalize_question(message)))
+        if answer is not None:
+            self.stats["exact_hits"] += 1
+            return answer
+        answer = self._near(prompt_key, message)
+        self.stats["near_hits" if answer is not None else "misses"] += 1
+        return answer
+
+    def store(self, system_prompt, message, history, answer):
+        if not answer or not standalone(message, history):
+            return
+        prompt_key = self._prompt_key(system_prompt)
+        self.exact.put(content_hash(prompt_key, normalize_question(message)), answer)
+        words = _content_words(message)
+        vector = self.embedder.embed([" ".join(words)])[0]
+        with self.lock:
+            if self.vectors is None:
+                self.vectors = np.zeros((self.max_near_entries, vector.shape[0]), dtype=np.float32)
+            row = self.next_row
+            self.vectors[row] = vector
+            entry = (prompt_key, self._anchors(message, words), time.time() + self.ttl, answer)
+            if row < len(self.entries):
+                self.entries[row] = entry
+            else:
+                self.entries.append(entry)
+            self.next_row = (row + 1) % self.max_near_entries
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        lookups = stats["exact_hits"] + stats["near_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["near_hits"]) / lookups if lookups else 0.0
+        stats["near_entries"] = len(self.entries)
+        return stats
+
+    def _prompt_key(self, system_prompt):
+        version = self.version()
+        if version != self.current_version:
+            with self.lock:
+                if version != self.current_version:
+                    if self.current_version is not None:
+                        self.stats["invalidations"] += 1
+                    # Exact keys include the version, so only the near-duplicate tier needs emptying
+                    self.entries, self.next_row = [], 0
+                    self.current_version = version
+        return content_hash(" ".join(system_prompt.split()), version)
+
+    def _near(self, prompt_key, message):
+        with self.lock:
+            if not self.entries:
+                return None
+            words = _content_words(message)
+            vector = self.embedder.embed([" ".join(words)])[0]
+            scores = self.vectors[:len(self.entries)] @ vector
+            anchors, now = self._anchors(message, words), time.time()
+            for row in np.argsort(-scores)[:8]:
+                if scores[row] < self.threshold:
+                    break
+                key, entry_anchors, expires, answer = self.entries[row]
+                if key == prompt_key and entry_anchors == anchors and expires > now:
+                    return answer
+        return None
+
+    def _anchors(self, message, words):
+        key_terms = set(self.key_terms())
+        anchors = {word for word in words if word in key_terms or word.isdigit() or word in NEGATION_WORDS}
+        if _negation.search(message.lower()):
+            anchors.add("not")
+        return frozenset(anchors)
+
+def _content_words(message):
+    return [word for word in _word.findall(message.lower()) if word not in FILLER_WORDS]
@@ -0,0 +1,134 @@
+# imports
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from telemetry import span, start_span, end_span, first_token_seconds, record_usage
+
+# Requests in flight at the same time for one model, across all sessions
+MAX_IN_FLIGHT_PER_MODEL = int(os.getenv("MAX_IN_FLIGHT_PER_MODEL", "32"))
+
+class FairLimiter:
+    """
+    Limits the requests in flight for one model. When the limit is reached, waiting sessions are served
+    round-robin, so one busy session cannot starve the others. A cancelled waiter leaves the queue and
+    never leaks a slot.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.queues = OrderedDict()  # session -> deque of futures waiting for a slot
+
+    async def acquire(self, session):
+        if self.in_flight < self.limit and not self.queues:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(session, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled: pass it on
+                self.release()
+            else:
+                self._forget(session, future)
+            raise
+
+    def release(self):
+        while self.queues:
+            session, queue = next(iter(self.queues.items()))
+            future = queue.popleft()
+            if queue:
+                self.queues.move_to_end(session)
+            else:
+                del self.queues[session]
+            if not future.done():
+                # The slot goes straight to the next session in turn
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def waiting(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def _forget(self, session, future):
+        queue = self.queues.get(session)
+        if queue and future in queue:
+            queue.remove(future)
+            if not queue:
+                del self.queues[session]
+
+_limiters = {}
+_client = None
+
+def get_limiter(model):
+    if model not in _limiters:
+        _limiters[model] = FairLimiter(MAX_IN_FLIGHT_PER_MODEL)
+    return _limiters[model]
+
+def get_async_client():
+    global _client
+    if _client is None:
+        from modelClient import create_async_client
+        _client = create_async_client()
+    return _client
+
+def session_id(request):
+    # Gradio gives each browser session a hash; calls without a request share one session
+    return getattr(request, "session_hash", None) or "anonymous"
+
+@asynccontextmanager
+async def model_slot(model, session):
+    limiter = get_limiter(model)
+    await limiter.acquire(session)
+    try:
+        yield
+    finally:
+        limiter.release()
+
+async def stream_completion(session, **kwargs):
+    """
+    Streams a chat completion on the shared async client while holding one of the model's slots.
+    If the caller is cancelled (e.g. the user disconnected), the upstream stream is closed and the slot freed.
+    The call is traced as a model_call span, with its time to first chunk and token usage.
+    """
+    model = kwargs["model"]
+    async with model_slot(model, session):
+        # Not made the current span: the caller's own spans run between our yields
+        started = start_span("model_call", model)
+        error, stream = None, None
+        try:
+            stream = await get_async_client().chat.completions.create(
+                stream=True, stream_options={"include_usage": True}, **kwargs)
+            first = True
+            async for chunk in stream:
+                if first:
+                    first_token_seconds.observe(time.perf_counter() - started[1], model)
+                    first = False
+                if chunk.usage:
+                    record_usage(model, chunk.usage)
+                    started[0].set(prompt_tokens=chunk.usage.prompt_tokens,
+                                   completion_tokens=chunk.usage.completion_tokens)
+                yield chunk
+        except BaseException as exception:
+            error = type(exception).__name__
+            raise
+        finally:
+            if stream is not None:
+                await stream.close()
+            end_span(started, error)
+
+async def complete(session, **kwargs):
+    """
+    A non-streaming chat completion on the shared async client, holding one of the model's slots.
+    """
+    async with model_slot(kwargs["model"], session):
+        with span("model_call", kwargs["model"]) as model_call:
+            response = await get_async_client().chat.completions.create(**kwargs)
+            record_usage(kwargs["model"], response.usage)
+            model_call.set(prompt_tokens=response.usage and response.usage.prompt_tokens,
+                           completion_tokens=response.usage and response.usage.completion_tokens)
+            return response
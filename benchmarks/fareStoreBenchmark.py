@@ -0,0 +1,78 @@
+# Benchmark: FareStore lookup latency with a large synthetic fare table
+#
+# Usage: python benchmarks/fareStoreBenchmark.py [cities] [origins]
+# Generates cities x (origins + 1) routes (default 5000 x 41 = 205,000) with an alias per city, then
+# times exact, alias ("City, Country"), misspelt (suggestions), batch and unknown-city lookups.
+
+import os
+import sys
+import csv
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fareStore import FareStore
+
+SYLLABLES = ["ka", "lo", "mi", "ran", "to", "be", "sa", "vel", "no", "dri", "pa", "gu", "zen", "or", "til", "mar"]
+LOOKUPS = 2000
+
+def city_name(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+def write_fares(path, cities, origins, rng):
+    names = set()
+    while len(names) < cities:
+        names.add(city_name(rng))
+    names = sorted(names)
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["origin", "destination", "price", "aliases"])
+        for name in names:
+            writer.writerow(["", name, f"${rng.randint(99, 2000)}", f"{name} land"])
+        for origin in names[:origins]:
+            for name in names:
+                writer.writerow([origin, name, f"${rng.randint(99, 2000)}", ""])
+    return names
+
+def misspell(name, rng):
+    i = rng.randrange(1, len(name) - 1)
+    return name[:i] + name[i + 1:] if rng.random() < 0.5 else name[:i] + name[i] + name[i:]
+
+def timed(label, calls):
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    mean = sum(latencies) / len(latencies)
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"{label:<24} mean {mean * 1e6:8.1f} us   p99 {p99 * 1e6:8.1f} us")
+
+def main(cities, origins):
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "fares.csv")
+        names = write_fares(path, cities, origins, rng)
+        start = time.perf_counter()
+        store = FareStore(path, os.path.join(directory, "fares.sqlite"))
+        print(f"import and index: {time.perf_counter() - start:.2f}s")
+
+        sample = [rng.choice(names) for _ in range(LOOKUPS)]
+        timed("exact", [lambda name=name: store.lookup(name) for name in sample])
+        timed("alias 'Name, Land'", [lambda name=name: store.lookup(f"{name.title()}, Land") for name in sample])
+        timed("route from origin", [lambda name=name: store.lookup(name, origin=names[0]) for name in sample])
+        timed("misspelt, suggested", [lambda name=name: store.suggest_city(misspell(name, rng)) for name in sample])
+        timed("batch of 5", [lambda: store.lookup_many(rng.sample(names, 5)) for _ in range(LOOKUPS)])
+        timed("unknown city", [lambda: store.lookup("xqzwv") for _ in range(LOOKUPS)])
+
+        misspelt = [misspell(name, rng) for name in sample]
+        found = sum(store.suggest_city(wrong) == name for wrong, name in zip(misspelt, sample))
+        priced = sum(store.lookup(wrong) is not None for wrong in misspelt)
+        print(f"misspellings suggesting the intended city: {found / LOOKUPS:.0%}, priced: {priced / LOOKUPS:.0%}")
+
+if __name__ == "__main__":
+    cities = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    origins = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    main(cities, origins)
@@ -0,0 +1,72 @@
+# Benchmark: prompt tokens per turn over a scripted 50-turn session, full history vs HistoryManager.compact
+#
+# Usage: python benchmarks/historyCompactionBenchmark.py [turns]
+# Runs offline: the summarizer is a stand-in that keeps the first sentence of each folded message,
+# capped at the size a real summary is asked to stay under.
+
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from historyManager import HistoryManager, prompt_tokens, SUMMARY_MAX_TOKENS
+from contextPacker import count_tokens
+
+MODEL = "gpt-4o-mini"
+SYSTEM = {"role": "system", "content": "You are a helpful assistant for an Airline called FlightAI."}
+
+def scripted_turn(i):
+    """
+    One user/assistant exchange. Every fourth turn looks up a website, which adds a large tool result.
+    """
+    city = ["London", "Paris", "Tokyo", "Berlin", "Madrid"][i % 5]
+    user = {"role": "user", "content": f"Turn {i}: what can you tell me about flights to {city} next month?"}
+    reply = " ".join(f"Flights to {city} leave daily from terminal {j % 3 + 1} and the return fare is ${799 + j}."
+                     for j in range(12))
+    messages = [user]
+    if i % 4 == 3:
+        messages.append({"role": "assistant", "content": None, "tool_calls": [
+            {"id": f"call_{i}", "type": "function",
+             "function": {"name": "get_website_details", "arguments": f'{{"url": "https://{city.lower()}.example"}}'}}]})
+        page = " ".join(f"Paragraph {j} about visiting {city}: museums, food, transport and hotels." for j in range(150))
+        messages.append({"role": "tool", "tool_call_id": f"call_{i}", "content": page})
+    messages.append({"role": "assistant", "content": reply})
+    return messages
+
+async def offline_summarize(previous_summary, messages, session):
+    lines = [previous_summary] if previous_summary else []
+    lines += [f"{m['role']}: {m['content'].split('.')[0]}." for m in messages if isinstance(m.get("content"), str)]
+    summary = "\n".join(lines)
+    while count_tokens(summary, MODEL) > SUMMARY_MAX_TOKENS:
+        summary = summary.split("\n", 1)[-1]
+    return summary
+
+async def main(turns):
+    manager = HistoryManager(MODEL, summarize=offline_summarize)
+    history = []
+    totals = {"full": 0, "compacted": 0}
+    elapsed = 0
+    print(f"{'turn':>4} {'full':>8} {'compacted':>10}")
+    for i in range(turns):
+        user, *answer = scripted_turn(i)
+        full = prompt_tokens([SYSTEM] + history + [user], MODEL)
+        start = time.perf_counter()
+        compacted = await manager.compact(history, "benchmark")
+        elapsed += time.perf_counter() - start
+        compacted = prompt_tokens([SYSTEM] + compacted + [user], MODEL)
+        totals["full"] += full
+        totals["compacted"] += compacted
+        # Stands in for streaming the reply, during which a background fold runs
+        await asyncio.sleep(0)
+        if (i + 1) % 5 == 0 or i == 0:
+            print(f"{i + 1:>4} {full:>8} {compacted:>10}")
+        history += [user] + answer
+    print(f"\nprompt tokens over {turns} turns: full {totals['full']}, compacted {totals['compacted']} "
+          f"({1 - totals['compacted'] / totals['full']:.0%} fewer)")
+    print(f"summaries {manager.stats['summaries']} (incremental {manager.stats['incremental']}, "
+          f"in the background {manager.stats['background']}, turns that waited for one {manager.stats['waited']}), "
+          f"compaction time {elapsed * 1000 / turns:.2f} ms/turn")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
@@ -0,0 +1,63 @@
+# Micro-benchmark: streaming PageExtractor vs the original whole-tree BeautifulSoup parse
+#
+# Usage: python benchmarks/htmlExtractionBenchmark.py [saved_page.html ...]
+# Without arguments a synthetic ~1 MB page is generated.
+
+import os
+import sys
+import time
+import tracemalloc
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from htmlExtractor import extract_page, CHUNK_SIZE
+
+def beautifulsoup_page(body):
+    # The parse Website used to do on every response
+    soup = BeautifulSoup(body, 'html.parser')
+    title = soup.title.string if soup.title else "No title found"
+    if soup.body:
+        for irrelevant in soup.body(["script", "style", "img", "input"]):
+            irrelevant.decompose()
+        text = soup.body.get_text(separator="\n", strip=True)
+    else:
+        text = ""
+    links = [link.get('href') for link in soup.find_all('a')]
+    return {"title": title, "text": text, "links": [link for link in links if link]}
+
+def streaming_page(body):
+    chunks = (body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+    return extract_page(chunks, max_bytes=len(body), max_text_chars=len(body))
+
+def synthetic_page(sections=4000):
+    parts = ["<html><head><title>Synthetic &amp; large</title><style>body{color:red}</style></head><body>"]
+    for i in range(sections):
+        parts.append(f"<div class='s'><h2>Section {i}</h2><p>Paragraph {i} with <b>bold</b> text &eacute; "
+                     f"and a <a href='/page/{i}'>link</a>.</p><img src='/i/{i}.png'>"
+                     f"<script>var x{i} = '<p>not text</p>';</script><!-- comment {i} --><input value='{i}'></div>")
+    parts.append("</body></html>")
+    return "".join(parts).encode("utf-8")
+
+def measure(function, body, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(body)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    function(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak
+
+def main(paths):
+    pages = [(path, open(path, "rb").read()) for path in paths] or [("synthetic", synthetic_page())]
+    for name, body in pages:
+        expected, soup_time, soup_peak = measure(beautifulsoup_page, body)
+        actual, stream_time, stream_peak = measure(streaming_page, body)
+        print(f"{name}: {len(body) / 1e6:.1f} MB, outputs match: {expected == actual}")
+        print(f"  BeautifulSoup  {soup_time * 1000:8.1f} ms  peak {soup_peak / 1e6:7.1f} MB")
+        print(f"  PageExtractor  {stream_time * 1000:8.1f} ms  peak {stream_peak / 1e6:7.1f} MB")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
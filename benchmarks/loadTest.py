@@ -0,0 +1,203 @@
+# Load test: drives each bot's chat handler with concurrent scripted conversations against a local
+# mock of the OpenAI API and a local static website, so nothing leaves the machine.
+#
+# Usage: python benchmarks/loadTest.py [bots ...] [--users 20] [--first-token-ms 300] [--compare old.json]
+#
+# Reports per bot: time to first token, p50/p95/p99 end-to-end latency of a turn, tool round-trip
+# time, throughput and speculative prefetch hit/waste rates, and saves them as JSON
+# (benchmarks/results/ by default) for comparing runs.
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import importlib
+import tempfile
+from datetime import datetime
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import mockOpenAI
+import siteFixture
+from chatbots import BOTS
+
+# The user messages of one scripted conversation per bot; {site} is the static site's url
+SCRIPTS = {
+    "chat": ["Hello! Can you help me plan a weekend away?", "What should I pack for it?", "Thanks, anything else?"],
+    "sales": ["I'm looking to buy a hat", "Do you sell belts?", "What about shoes?"],
+    "airline": ["How much is a ticket to London?", "And how much is a ticket to Tokio?", "Great, and Berlin?"],
+    "voice": ["How much is a ticket to London?", "And how much is a ticket to Paris?"],
+    "website": ["Tell me about the company at {site}", "What jobs do they have on {site}?"],
+    "social": ["Tell me about the company at {site}", "What do they sell on {site}?"],
+    "brochure": ["Write a brochure for {site}"],
+}
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))]
+
+def summarize(values):
+    return {"count": len(values), "mean": sum(values) / len(values) if values else None,
+            "p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99)}
+
+def instrument_tools(module, samples):
+    # Time each batch of tool calls the bot makes, by wrapping its dispatcher
+    dispatcher = getattr(module, "dispatcher", None)
+    if dispatcher is None:
+        return
+    original = dispatcher.adispatch
+
+    async def timed_adispatch(tool_calls):
+        start = time.perf_counter()
+        try:
+            return await original(tool_calls)
+        finally:
+            samples.append(time.perf_counter() - start)
+
+    dispatcher.adispatch = timed_adispatch
+
+async def run_turn(name, module, message, history, request):
+    """
+    Returns:
+        tuple: (seconds to the first text, seconds to the end of the reply, reply)
+    """
+    start = time.perf_counter()
+    first, reply = None, ""
+    if name == "voice":
+        # The voice bot takes the history with the new message and yields (history, image, audio)
+        async for updated, _, _ in module.chat(history + [{"role": "user", "content": message}], request):
+            reply = updated[-1]["content"] or ""
+            if reply and first is None:
+                first = time.perf_counter() - start
+    else:
+        async for reply in module.chat(message, history, request):
+            if reply and first is None:
+                first = time.perf_counter() - start
+    return first, time.perf_counter() - start, reply
+
+async def run_conversation(name, module, script, user, site_url, turns):
+    request = SimpleNamespace(session_hash=f"{name}-{user}")
+    history = []
+    for message in script:
+        message = message.format(site=site_url)
+        try:
+            first, latency, reply = await run_turn(name, module, message, history, request)
+            turns.append({"ttft": first, "latency": latency, "error": None})
+        except Exception as error:
+            turns.append({"ttft": None, "latency": None, "error": repr(error)})
+            return
+        history = history + [{"role": "user", "content": message}, {"role": "assistant", "content": reply}]
+
+async def load_bot(name, users, site_url, mock_counts):
+    module = importlib.import_module(BOTS[name])
+    tool_samples, turns = [], []
+    instrument_tools(module, tool_samples)
+    calls_before = dict(mock_counts)
+    start = time.perf_counter()
+    await asyncio.gather(*(run_conversation(name, module, SCRIPTS[name], user, site_url, turns)
+                           for user in range(users)))
+    wall = time.perf_counter() - start
+    completed = [turn for turn in turns if turn["error"] is None]
+    return {
+        "users": users,
+        "turns": len(turns),
+        "errors": sorted({turn["error"] for turn in turns if turn["error"]}),
+        "wall_seconds": wall,
+        "turns_per_second": len(completed) / wall if wall else None,
+        "ttft": summarize([turn["ttft"] for turn in completed if turn["ttft"] is not None]),
+        "latency": summarize([turn["latency"] for turn in completed]),
+        "tool_round_trip": summarize(tool_samples),
+        "api_calls": {path: count - calls_before.get(path, 0) for path, count in mock_counts.items()
+                      if count != calls_before.get(path, 0)},
+        "prefetch": module.crawler.prefetcher.get_stats() if hasattr(module, "crawler") else None,
+    }
+
+def print_report(results, previous=None):
+    def ms(value):
+        return f"{value * 1000:8.0f}" if value is not None else "       -"
+    print(f"\n{'bot':<10} {'turns/s':>8} {'ttft p50':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'tool p50':>8} {'errors':>6}")
+    for name, bot in results["bots"].items():
+        print(f"{name:<10} {bot['turns_per_second']:8.2f} {ms(bot['ttft']['p50'])} {ms(bot['latency']['p50'])} "
+              f"{ms(bot['latency']['p95'])} {ms(bot['latency']['p99'])} {ms(bot['tool_round_trip']['p50'])} "
+              f"{len(bot['errors']):>6}")
+        old = (previous or {}).get("bots", {}).get(name)
+        if old and old["latency"]["p95"] and bot["latency"]["p95"]:
+            print(f"{'':<10} vs previous run: turns/s {bot['turns_per_second'] / old['turns_per_second'] - 1:+.0%}, "
+                  f"p95 {bot['latency']['p95'] / old['latency']['p95'] - 1:+.0%}")
+        if bot.get("prefetch"):
+            print(f"{'':<10} prefetch: hit rate {bot['prefetch']['hit_rate']:.0%}, "
+                  f"waste rate {bot['prefetch']['waste_rate']:.0%}, {bot['prefetch']['skipped']} skipped")
+        for error in bot["errors"]:
+            print(f"{'':<10} error: {error}")
+    print("(times in ms)")
+
+async def run(args):
+    config = mockOpenAI.config_from(args)
+    if args.api_url:
+        server, base_url, counts = None, args.api_url, {}
+    else:
+        server, base_url = mockOpenAI.serve(config=config)
+        counts = server.RequestHandlerClass.counts
+    site, site_url = siteFixture.serve(pages=args.site_pages, latency_ms=args.site_latency_ms)
+    results = {"started": datetime.now().isoformat(timespec="seconds"),
+               "config": {"users": args.users, "site_pages": args.site_pages, "api_url": args.api_url,
+                          "site_latency_ms": args.site_latency_ms, **vars(config)},
+               "bots": {}}
+    # The bots load .env when first imported; load it now so nothing overrides pointing them at the mock
+    importlib.import_module("bootstrap").initialize()
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "mock"
+    try:
+        for name in args.bots:
+            print(f"Load testing {name} with {args.users} concurrent conversations...")
+            results["bots"][name] = await load_bot(name, args.users, site_url, counts)
+    finally:
+        if server:
+            server.shutdown()
+        site.shutdown()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the chatbots")
+    parser.add_argument("bots", nargs="*", help=f"bots to test: {', '.join(sorted(BOTS))} (default: all)")
+    parser.add_argument("--users", type=int, default=20, help="concurrent conversations per bot")
+    parser.add_argument("--site-pages", type=int, default=20)
+    parser.add_argument("--site-latency-ms", type=float, default=50)
+    parser.add_argument("--api-url", help="a mock API started separately with benchmarks/mockOpenAI.py, so at high "
+                        "concurrency it does not share this process (its latency options then apply there)")
+    parser.add_argument("--output", help="where to save the JSON results")
+    parser.add_argument("--compare", help="a previous JSON result to compare with")
+    parser.add_argument("--keep-cache", action="store_true",
+                        help="use the normal cache directory instead of a fresh one (warm caches)")
+    mockOpenAI.add_arguments(parser)
+    args = parser.parse_args()
+    args.bots = args.bots or sorted(BOTS)
+    unknown = set(args.bots) - set(BOTS)
+    if unknown:
+        parser.error(f"unknown bots: {', '.join(sorted(unknown))}")
+
+    if not args.keep_cache:
+        # Must be set before the bots import crawlCache
+        os.environ["CHATBOT_CACHE_DIR"] = tempfile.mkdtemp(prefix="chatbot-loadtest-")
+    results = asyncio.run(run(args))
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            previous = json.load(file)
+    print_report(results, previous)
+    output = args.output or os.path.join(ROOT, "benchmarks", "results",
+                                         f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"Saved {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# A local stand-in for the OpenAI API, for load tests that must not touch the network
+#
+# Usage: python benchmarks/mockOpenAI.py [--port 8765] [--first-token-ms 300] [--tokens-per-second 80] ...
+# then point the bots at it: OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock
+#
+# Speaks /v1/chat/completions (streaming, tool calls, JSON mode), /v1/images/generations,
+# /v1/audio/speech and /v1/embeddings. When tools are offered and the last message is from the user,
+# the reply is a call of the first tool, with arguments taken from the user message (a URL for url
+# parameters, the last word otherwise); after the tool results it streams a text reply.
+# --error-rate and --slow-rate make a share of requests fail with 429 (and a Retry-After) or stall,
+# to exercise the client's retries and hedging.
+
+import re
+import sys
+import math
+import json
+import time
+import uuid
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import urljoin
+from dataclasses import dataclass
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# A 1x1 PNG and a few bytes standing in for an MP3
+PNG = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==")
+MP3 = b"ID3\x03\x00\x00\x00\x00\x00\x00" + b"\xff\xfb\x90\x00" * 64
+
+WORDS = ("the flight leaves on time and our team will be happy to help you plan every part "
+         "of your trip with great fares friendly service and comfortable seats").split()
+
+_url = re.compile(r"https?://[^\s\"'<>)\]]+")
+
+@dataclass
+class MockConfig:
+    first_token_ms: float = 300       # delay before the first chunk of a completion
+    tokens_per_second: float = 80     # pace of the streamed tokens
+    reply_tokens: int = 60            # tokens in a text reply
+    image_ms: float = 2000            # latency of an image generation
+    speech_ms: float = 400            # latency of a speech synthesis
+    embedding_ms: float = 50
+    error_rate: float = 0.0           # share of requests answered 429 Too Many Requests
+    retry_after_ms: float = 200       # the Retry-After sent with a 429
+    slow_rate: float = 0.0            # share of requests delayed by slow_ms before anything else
+    slow_ms: float = 3000
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 drops connections when many clients connect at once, and the
+    # client only retries them seconds later, which would show up as latency
+    request_queue_size = 128
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = MockConfig()
+    counts = {}
+    counts_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on the request, e.g. the slower of two hedged requests
+            pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.split("?")[0].rstrip("/")
+        with self.counts_lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+        if random.random() < self.config.error_rate:
+            with self.counts_lock:
+                self.counts["429"] = self.counts.get("429", 0) + 1
+            self.send_json({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                           status=429, headers={"retry-after-ms": str(int(self.config.retry_after_ms)),
+                                                "Retry-After": str(math.ceil(self.config.retry_after_ms / 1000))})
+            return
+        if random.random() < self.config.slow_rate:
+            time.sleep(self.config.slow_ms / 1000)
+        if path.endswith("/chat/completions"):
+            self.chat_completion(body)
+        elif path.endswith("/images/generations"):
+            time.sleep(self.config.image_ms / 1000)
+            self.send_json({"created": int(time.time()), "data": [{"b64_json": base64.b64encode(PNG).decode()}]})
+        elif path.endswith("/audio/speech"):
+            time.sleep(self.config.speech_ms / 1000)
+            self.send_body(MP3, "audio/mpeg")
+        elif path.endswith("/embeddings"):
+            time.sleep(self.config.embedding_ms / 1000)
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            self.send_json({"object": "list", "model": body.get("model"), "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text)} for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+        else:
+            self.send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+    def chat_completion(self, body):
+        messages = body.get("messages", [])
+        prompt_tokens = len(json.dumps(messages)) // 4
+        tool_call = None
+        if body.get("tools") and messages and messages[-1]["role"] == "user":
+            tool_call = make_tool_call(body["tools"][0]["function"], messages[-1].get("content") or "")
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            text = json.dumps(pick_links(messages[-1].get("content") or ""))
+        else:
+            text = " ".join(WORDS[i % len(WORDS)] for i in range(self.config.reply_tokens))
+        completion_tokens = 20 if tool_call else len(text.split())
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+
+        time.sleep(self.config.first_token_ms / 1000)
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": None if tool_call else text}
+            if tool_call:
+                message["tool_calls"] = [tool_call]
+            self.send_json({"id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion",
+                            "created": int(time.time()), "model": body.get("model"), "usage": usage,
+                            "choices": [{"index": 0, "message": message,
+                                         "finish_reason": "tool_calls" if tool_call else "stop"}]})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk_id, model = f"chatcmpl-{uuid.uuid4().hex}", body.get("model")
+
+        def send_chunk(delta, finish_reason=None, **extra):
+            choices = [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else []
+            self.send_event({"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": model, "choices": choices, **extra})
+
+        if tool_call:
+            arguments = tool_call["function"]["arguments"]
+            send_chunk({"role": "assistant", "tool_calls": [{"index": 0, "id": tool_call["id"], "type": "function",
+                        "function": {"name": tool_call["function"]["name"], "arguments": ""}}]})
+            for start in range(0, len(arguments), 8):
+                send_chunk({"tool_calls": [{"index": 0, "function": {"arguments": arguments[start:start + 8]}}]})
+            send_chunk({}, "tool_calls")
+        else:
+            send_chunk({"role": "assistant", "content": ""})
+            for i, word in enumerate(text.split(" ")):
+                if i:
+                    time.sleep(1 / self.config.tokens_per_second)
+                send_chunk({"content": word if i == 0 else " " + word})
+            send_chunk({}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send_chunk(None, usage=usage)
+        self.send_raw(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_event(self, payload):
+        self.send_raw(f"data: {json.dumps(payload)}\n\n".encode())
+
+    def send_raw(self, data):
+        # One HTTP chunk per event, flushed straight away like the real API
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, payload, status=200, headers=None):
+        self.send_body(json.dumps(payload).encode(), "application/json", status, headers)
+
+    def send_body(self, data, content_type, status=200, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+def make_tool_call(function, user_message):
+    """
+    A call of function with every required argument filled from the user message.
+    """
+    urls = _url.findall(user_message)
+    words = [word.strip(".-") for word in re.findall(r"[\w.-]+", user_message)]
+    arguments = {}
+    for name in function.get("parameters", {}).get("required", []):
+        if "url" in name.lower():
+            arguments[name] = urls[0] if urls else (words[-1] if words else "")
+        else:
+            arguments[name] = words[-1] if words else ""
+    return {"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function",
+            "function": {"name": function["name"], "arguments": json.dumps(arguments)}}
+
+def pick_links(prompt):
+    # What the link selection prompt expects back: a few of the links it was shown, made absolute
+    found = [url.rstrip(".,") for url in _url.findall(prompt)]
+    base = found[0] if found else "https://example.com"
+    urls = found[1:] + [urljoin(base + "/", line.strip()) for line in prompt.splitlines() if line.startswith("/")]
+    chosen = [url for url in urls if "about" in url or "careers" in url][:3] or urls[:2]
+    return {"links": [{"type": "about page" if "about" in url else "careers page", "url": url} for url in chosen]}
+
+def fake_embedding(text, dimensions=64):
+    digest = hashlib.sha256(text.encode()).digest()
+    return [(digest[i % len(digest)] - 128) / 128 for i in range(dimensions)]
+
+def serve(port=0, config=None):
+    """
+    Starts the mock server on a background thread.
+
+    Returns:
+        tuple: (server, base_url) - call server.shutdown() to stop it.
+    """
+    handler = type("ConfiguredMockOpenAIHandler", (MockOpenAIHandler,),
+                   {"config": config or MockConfig(), "counts": {}})
+    server = Server(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+def add_arguments(parser):
+    defaults = MockConfig()
+    for field in MockConfig.__dataclass_fields__:
+        parser.add_argument("--" + field.replace("_", "-"), type=type(getattr(defaults, field)),
+                            default=getattr(defaults, field))
+
+def config_from(args):
+    return MockConfig(**{field: getattr(args, field) for field in MockConfig.__dataclass_fields__})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI API")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server, base_url = serve(args.port, config_from(args))
+    print(f"Mock OpenAI API at {base_url}  (OPENAI_BASE_URL={base_url} OPENAI_API_KEY=mock)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
@@ -0,0 +1,79 @@
+# Benchmark: the shared model client against a mock API that answers some requests with 429s and
+# stalls others
+#
+# Usage: python benchmarks/modelClientBenchmark.py [--calls 400] [--concurrency 20] [--error-rate 0.1] [--slow-rate 0.03]
+#
+# Sends the same non-streaming completions through a bare AsyncOpenAI client without retries, one with
+# the SDK's own retries, and the AsyncModelClient wrapper (retries honouring Retry-After, plus hedging, turned on here),
+# and reports the share of calls that succeeded and their p50/p95/p99 latency.
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import mockOpenAI
+import modelClient
+from openai import AsyncOpenAI
+
+MESSAGES = [{"role": "system", "content": "You are a helpful assistant"},
+            {"role": "user", "content": "Pick the relevant links for https://example.com/about"}]
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))] if values else float("nan")
+
+async def run(label, client, calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await client.chat.completions.create(model="gpt-4o-mini", messages=MESSAGES)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    wall = time.perf_counter() - start
+    # Idle keep-alive connections left open would hold the mock's threads into the next run
+    await client.close()
+    print(f"{label:<28} ok {len(latencies) / calls:6.1%}   p50 {percentile(latencies, 50) * 1000:7.0f} ms   "
+          f"p95 {percentile(latencies, 95) * 1000:7.0f} ms   p99 {percentile(latencies, 99) * 1000:7.0f} ms   "
+          f"{calls / wall:6.1f} calls/s")
+
+async def main(args):
+    config = mockOpenAI.config_from(args)
+    # Loads the tokenizer the client estimates token use with, so its first call is not timed doing it
+    modelClient.estimate_tokens("chat", {"model": "gpt-4o-mini", "messages": MESSAGES})
+    server, base_url = mockOpenAI.serve(config=config)
+    print(f"{args.calls} calls, {args.concurrency} at a time; {config.error_rate:.0%} get a 429 "
+          f"(Retry-After {config.retry_after_ms:.0f} ms), {config.slow_rate:.0%} stall for {config.slow_ms:.0f} ms")
+    try:
+        await run("no retries", AsyncOpenAI(base_url=base_url, api_key="mock", max_retries=0),
+                  args.calls, args.concurrency)
+        await run("SDK retries (2)", AsyncOpenAI(base_url=base_url, api_key="mock", max_retries=2),
+                  args.calls, args.concurrency)
+        wrapped = modelClient.AsyncModelClient(AsyncOpenAI(base_url=base_url, api_key="mock", max_retries=0), hedging=True)
+        await run("model client", wrapped, args.calls, args.concurrency)
+        hedges = {labels[1]: value for labels, value in modelClient.hedges_total.values.items()}
+        retries = sum(modelClient.retries_total.values.values())
+        print(f"model client: {retries} retries, {hedges.get('sent', 0)} hedged requests, "
+              f"{hedges.get('won', 0)} of them answered first")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model client retries and hedging against a flaky mock API")
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    mockOpenAI.add_arguments(parser)
+    parser.set_defaults(first_token_ms=100, error_rate=0.1, slow_rate=0.03, slow_ms=2000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,120 @@
+# Benchmark: chat latency of other sessions while heavy pages are being scraped, with pages parsed in
+# the serving process and in the parser pool
+#
+# Usage: python benchmarks/parserPoolBenchmark.py [--scrapers 4] [--sessions 4] [--turns 10] [--sections 4000]
+#
+# Streams completions from a local mock of the OpenAI API in a few concurrent sessions, first with
+# nothing else running, then while scraper threads fetch a synthetic ~1 MB page from a local site in
+# a loop, once with PARSE_WORKERS=0 and once with the pool, and reports time to first token and
+# end-to-end latency of the turns. Like a bot run as a script, it initializes at import with a metrics
+# port set, so it also checks that the parser workers, which import it again, leave the port to it.
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("CHATBOT_CACHE_DIR", tempfile.mkdtemp(prefix="chatbot-parser-"))
+with socket.socket() as probe:
+    probe.bind(("127.0.0.1", 0))
+    os.environ.setdefault("METRICS_PORT", str(probe.getsockname()[1]))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+from bootstrap import initialize
+initialize()
+import mockOpenAI
+import siteFixture
+import parserPool
+import websiteScraper
+from htmlExtractionBenchmark import synthetic_page
+from openai import AsyncOpenAI
+
+MESSAGES = [{"role": "system", "content": "You are a helpful assistant"},
+            {"role": "user", "content": "What should I pack for a weekend away?"}]
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))] if values else float("nan")
+
+def scrape(site_url, stop, pages):
+    # A new query string per fetch, so the page is never revalidated and always parsed again
+    while not stop.is_set():
+        websiteScraper.Website(f"{site_url}/?n={time.monotonic_ns()}")
+        pages.append(1)
+
+async def chat(client, sessions, turns):
+    first_tokens, latencies = [], []
+
+    async def session():
+        for _ in range(turns):
+            start = time.perf_counter()
+            stream = await client.chat.completions.create(model="gpt-4o-mini", messages=MESSAGES, stream=True)
+            first = None
+            async for chunk in stream:
+                if first is None and chunk.choices and chunk.choices[0].delta.content:
+                    first = time.perf_counter() - start
+            first_tokens.append(first)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(session() for _ in range(sessions)))
+    return first_tokens, latencies
+
+async def run(label, client, args, site_url=None):
+    stop, pages, threads = threading.Event(), [], []
+    if site_url:
+        threads = [threading.Thread(target=scrape, args=(site_url, stop, pages)) for _ in range(args.scrapers)]
+        for thread in threads:
+            thread.start()
+    start = time.perf_counter()
+    try:
+        first_tokens, latencies = await chat(client, args.sessions, args.turns)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    wall = time.perf_counter() - start
+    print(f"{label:<24} first token p50 {percentile(first_tokens, 50) * 1000:6.0f} ms  "
+          f"p99 {percentile(first_tokens, 99) * 1000:6.0f} ms   turn p50 {percentile(latencies, 50) * 1000:6.0f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:6.0f} ms   {len(pages) / wall:5.1f} pages/s")
+
+async def main(args):
+    body = synthetic_page(args.sections)
+    handler = type("HeavySiteHandler", (siteFixture.SiteHandler,), {"site": {"/": body}, "latency": 0})
+    site = mockOpenAI.Server(("127.0.0.1", 0), handler)
+    threading.Thread(target=site.serve_forever, daemon=True).start()
+    site_url = f"http://127.0.0.1:{site.server_address[1]}"
+    server, base_url = mockOpenAI.serve(config=mockOpenAI.MockConfig(first_token_ms=args.first_token_ms))
+    client = AsyncOpenAI(base_url=base_url, api_key="mock")
+    workers = parserPool.PARSE_WORKERS or 4
+    print(f"{args.sessions} sessions x {args.turns} turns; {args.scrapers} scrapers fetching a "
+          f"{len(body) / 1e6:.1f} MB page; {workers} parser processes")
+    try:
+        await run("no scraping", client, args)
+        parserPool.PARSE_WORKERS = 0
+        await run("parsed in process", client, args, site_url)
+        parserPool.PARSE_WORKERS = workers
+        # Starts the workers, so spawning them is not timed
+        await asyncio.gather(*(asyncio.to_thread(parserPool.parse_body, body) for _ in range(workers)))
+        await run("parser pool", client, args, site_url)
+        parsed = {labels[0]: value for labels, value in parserPool.pages_parsed_total.values.items()}
+        print("pages parsed:", parsed)
+        if parsed.get("fallback") or parsed.get("timeout"):
+            print("parser workers failed or didn't answer in time; part of the pool phase ran in process")
+    finally:
+        await client.close()
+        server.shutdown()
+        site.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chat latency while heavy pages are scraped")
+    parser.add_argument("--scrapers", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--sections", type=int, default=4000, help="size of the synthetic page")
+    parser.add_argument("--first-token-ms", type=float, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,87 @@
+# A local static website for scraper load tests
+#
+# Usage: python benchmarks/siteFixture.py [--port 8766] [--pages 20] [--latency-ms 50]
+#
+# The home page links to an about page, a careers page and product pages; every page has a few
+# paragraphs, navigation, a script and a style block, and honours If-None-Match with 304s.
+
+import sys
+import time
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler
+from mockOpenAI import Server
+
+def build_site(pages=20, paragraphs=12):
+    """
+    Returns:
+        dict: path -> HTML bytes.
+    """
+    paths = ["/about", "/careers"] + [f"/products/{i}" for i in range(pages)]
+    navigation = "".join(f"<li><a href='{path}'>{path.strip('/').title()}</a></li>" for path in paths)
+    site = {}
+    for path in ["/"] + paths:
+        title = "Example Corp" if path == "/" else f"Example Corp - {path.strip('/').title()}"
+        body = "".join(f"<p>{title} paragraph {i}: we build reliable widgets for customers in over "
+                       f"{i + 10} countries, with teams in engineering, sales and support.</p>"
+                       for i in range(paragraphs))
+        site[path] = (f"<html><head><title>{title}</title><style>p {{margin: 0}}</style></head><body>"
+                      f"<nav><ul>{navigation}</ul></nav><h1>{title}</h1>{body}"
+                      f"<script>var tracking = '{path}';</script><footer>Contact us</footer></body></html>").encode()
+    return site
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    site = {}
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        page = self.site.get(self.path.split("?")[0].rstrip("/") or "/")
+        if page is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        etag = '"' + hashlib.sha1(page).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(page)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(page)
+
+def serve(port=0, pages=20, latency_ms=50):
+    """
+    Starts the site on a background thread.
+
+    Returns:
+        tuple: (server, base_url) - call server.shutdown() to stop it.
+    """
+    handler = type("ConfiguredSiteHandler", (SiteHandler,), {"site": build_site(pages), "latency": latency_ms / 1000})
+    server = Server(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local static website for scraper load tests")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args()
+    server, base_url = serve(args.port, args.pages, args.latency_ms)
+    print(f"Static site at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
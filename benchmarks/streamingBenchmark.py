@@ -0,0 +1,60 @@
+# Benchmark: server CPU and bytes per answer, per-token yields vs coalesced updates
+#
+# Usage: python benchmarks/streamingBenchmark.py [tokens] [seconds_per_token]
+# A fake stream delivers a reply of `tokens` ~4-character tokens (default 2000), optionally paced like a
+# model (default 1 ms per token). Each update is JSON-encoded the way the server sends it to the browser.
+# "full bytes" is what is sent when every update carries the whole text so far; "delta bytes" is what is
+# sent when an update carries only the appended text.
+
+import os
+import sys
+import json
+import time
+import asyncio
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chatStreaming import StreamedTurn, coalesce
+
+def fake_chunk(text):
+    delta = SimpleNamespace(content=text, tool_calls=None)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)])
+
+async def fake_stream(tokens, pace):
+    for i in range(tokens):
+        if pace:
+            await asyncio.sleep(pace)
+        yield fake_chunk(f" w{i % 100:02d}")
+
+async def per_token(stream):
+    # The loop the bots used to run
+    response = ""
+    async for chunk in stream:
+        response += chunk.choices[0].delta.content or ''
+        yield response
+
+async def coalesced(stream):
+    async for response in coalesce(StreamedTurn().aconsume(stream)):
+        yield response
+
+async def measure(handler, tokens, pace):
+    updates, full_bytes, delta_bytes, shown = 0, 0, 0, 0
+    start_cpu, start = time.process_time(), time.perf_counter()
+    async for response in handler(fake_stream(tokens, pace)):
+        updates += 1
+        full_bytes += len(json.dumps({"msg": "process_generating", "output": {"data": [response]}}))
+        delta_bytes += len(json.dumps({"msg": "process_generating", "output": {"data": [response[shown:]]}}))
+        shown = len(response)
+    return updates, full_bytes, delta_bytes, time.process_time() - start_cpu, time.perf_counter() - start
+
+async def main(tokens, pace):
+    print(f"{tokens}-token reply, {pace * 1000:g} ms per token")
+    print(f"{'mode':<10} {'updates':>8} {'full bytes':>12} {'delta bytes':>12} {'cpu ms':>8} {'wall s':>7}")
+    for name, handler in [("per-token", per_token), ("coalesced", coalesced)]:
+        updates, full_bytes, delta_bytes, cpu, wall = await measure(handler, tokens, pace)
+        print(f"{name:<10} {updates:>8} {full_bytes:>12} {delta_bytes:>12} {cpu * 1000:>8.1f} {wall:>7.2f}")
+
+if __name__ == "__main__":
+    tokens = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    pace = float(sys.argv[2]) if len(sys.argv) > 2 else 0.001
+    asyncio.run(main(tokens, pace))
@@ -0,0 +1,84 @@
+# imports
+import os
+import logging
+import importlib
+import threading
+import multiprocessing
+from dotenv import load_dotenv
+import telemetry
+
+_initialized = set()
+_lock = threading.Lock()
+
+def initialize(*key_names):
+    """
+    Loads .env, sets up logging (LOG_LEVEL) and telemetry, and reports which API keys are set. Safe to
+    call from every bot: the environment is loaded once and each key is reported once, however many bots
+    the process imports.
+    """
+    # A child process, e.g. a parser worker, leaves the metrics server and key report to its parent. A
+    # spawned child imports the parent's __main__ before parent_process() is set, but already has its name.
+    child = multiprocessing.current_process().name != "MainProcess" or multiprocessing.parent_process() is not None
+    with _lock:
+        if not _initialized:
+            load_dotenv(override=True)
+            logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                                format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+            # The OpenAI client logs every HTTP request at INFO; telemetry covers those calls
+            logging.getLogger("httpx").setLevel(max(logging.WARNING, logging.getLogger().level))
+            if not child:
+                telemetry.configure()
+            _initialized.add(None)
+        for name in key_names:
+            if name in _initialized or child:
+                continue
+            _initialized.add(name)
+            label = name.replace("_API_KEY", "").title().replace("Openai", "OpenAI")
+            key = os.getenv(name)
+            if key:
+                print(f"{label} API Key exists and begins {key[:8]}")
+            else:
+                print(f"{label} API Key not set")
+
+class LazyModule:
+    """
+    A module that is only imported the first time one of its attributes is used
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+def lazy_import(name):
+    return LazyModule(name)
+
+class LazyClient:
+    """
+    Stands in for a client object and only creates it (importing its package) when it is first used
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attribute):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return getattr(self._client, attribute)
+
+def _create_openai():
+    # Imported here so the rate limits are read after .env is loaded
+    from modelClient import create_client
+    return create_client()
+
+# The synchronous client the tools use, with the shared rate limits, retries and hedging of
+# modelClient; the openai package is imported on first use
+openai = LazyClient(_create_openai)
@@ -0,0 +1,258 @@
+# imports
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from bootstrap import lazy_import
+from crawlCache import normalize_url
+
+log = logging.getLogger(__name__)
+
+# The brochure bot (and gradio) and the scraper are only loaded once there are sites to process
+brochures = lazy_import("openaiGradioChatbotRAGWebsiteBrochure")
+websiteScraper = lazy_import("websiteScraper")
+
+# Sites in each stage at the same time, in pipeline order
+STAGE_LIMITS = {
+    "fetch": 16,     # landing page downloads
+    "links": 8,      # link selection completions
+    "pages": 8,      # sub-page crawls, together fetching up to websiteScraper.MAX_WORKERS pages
+    "brochure": 8,   # brochure completions
+}
+MAX_IN_FLIGHT = 64   # sites between being read and being written; bounds the pages held in memory
+
+def read_sites(lines):
+    """
+    Yields (url, company name) for each line holding a url, optionally followed by the company name.
+    Blank lines and lines starting with # are skipped; the name defaults to the url.
+    """
+    for line in lines:
+        parts = line.strip().split(None, 1)
+        if not parts or parts[0].startswith("#"):
+            continue
+        yield parts[0], parts[1] if len(parts) > 1 else parts[0]
+
+def read_checkpoint(path):
+    """
+    Returns:
+        set: Normalized urls of the sites a previous run finished.
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            return {line.strip() for line in file if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))] if values else None
+
+class _Site:
+    __slots__ = ("url", "company", "key", "cache_key", "started", "stages", "landing", "links", "pages")
+
+    def __init__(self, url, company):
+        self.url, self.company, self.key = url, company, normalize_url(url)
+        self.cache_key = f"{company}|{self.key}"
+        self.started, self.stages = time.perf_counter(), {}
+        self.landing = self.links = self.pages = None
+
+class BrochurePipeline:
+    """
+    Writes brochures for many sites. Each site passes through four stages - landing page fetch, link
+    selection, sub-page fetch and brochure completion - and each stage runs on its own thread pool,
+    so a slow stage never holds up the sites in the others. Model calls go through the shared client,
+    which keeps them within the rate limits.
+
+    Every finished site is appended to a JSONL file as soon as it is done, with its brochure or the
+    error that stopped it. Sites that got a brochure are also recorded in a checkpoint file, and a
+    later run with the same checkpoint skips them; failed sites are tried again.
+    """
+
+    def __init__(self, output, checkpoint, limits=STAGE_LIMITS, max_in_flight=MAX_IN_FLIGHT):
+        """
+        Args:
+            output (str): The JSONL file to append results to.
+            checkpoint (str): The file recording finished sites, read at start and appended to.
+            limits (dict): Stage name -> sites in that stage at the same time.
+            max_in_flight (int): Sites in the pipeline at the same time.
+        """
+        self.stages = [("fetch", self._fetch), ("links", self._select_links),
+                       ("pages", self._fetch_pages), ("brochure", self._write)]
+        self.executors = {name: ThreadPoolExecutor(max_workers=limits[name], thread_name_prefix=f"batch-{name}")
+                          for name, _ in self.stages}
+        self.admission = threading.BoundedSemaphore(max_in_flight)
+        self.finished = read_checkpoint(checkpoint)
+        self.output = open(output, "a", encoding="utf-8")
+        self.checkpoint = open(checkpoint, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.pending = 0
+        self.stopping = False
+        self.stats = {"written": 0, "cached": 0, "failed": 0, "skipped": 0}
+        self.latencies = {name: [] for name, _ in self.stages}
+        self.site_latencies = []
+        self.started = time.perf_counter()
+
+    def run(self, sites):
+        """
+        Passes every (url, company name) of sites through the pipeline and returns once all are written.
+        Sites in the checkpoint and repeated urls are skipped.
+        """
+        seen = set()
+        for url, company in sites:
+            key = normalize_url(url)
+            if key in self.finished or key in seen:
+                self.stats["skipped"] += 1
+                continue
+            seen.add(key)
+            self.admission.acquire()
+            with self.lock:
+                self.pending += 1
+            site = _Site(url, company)
+            try:
+                self._start(site)
+            except Exception as error:
+                self._finish(site, error=error, stage="cache")
+        with self.idle:
+            self.idle.wait_for(lambda: not self.pending)
+
+    def stop(self):
+        """
+        Stops taking sites: queued stages are dropped and running ones end their site there, unwritten,
+        so the next run does those sites again.
+        """
+        self.stopping = True
+        for executor in self.executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        for executor in self.executors.values():
+            executor.shutdown()
+        self.output.close()
+        self.checkpoint.close()
+
+    def _start(self, site):
+        brochure = brochures.brochure_cache.get(site.cache_key)
+        if brochure is not None:
+            self._finish(site, brochure=brochure, cached=True)
+            return
+        site.pages = brochures.crawler.pages_cache.get(site.key)
+        # A site crawled before, e.g. by the chat bot, only needs its brochure written
+        self._submit(3 if site.pages is not None else 0, site)
+
+    def _submit(self, index, site):
+        name = self.stages[index][0]
+        self.executors[name].submit(contextvars.copy_context().run, self._run_stage, index, site)
+
+    def _run_stage(self, index, site):
+        name, function = self.stages[index]
+        start = time.perf_counter()
+        try:
+            result = function(site)
+        except Exception as error:
+            self._timed(name, site, start)
+            self._finish(site, error=error, stage=name)
+            return
+        self._timed(name, site, start)
+        if index + 1 == len(self.stages):
+            self._finish(site, brochure=result)
+        elif not self.stopping:
+            self._submit(index + 1, site)
+
+    def _timed(self, name, site, start):
+        site.stages[name] = time.perf_counter() - start
+        with self.lock:
+            self.latencies[name].append(site.stages[name])
+
+    def _fetch(self, site):
+        site.landing = websiteScraper.fetch_website(site.url, timeout=websiteScraper.PAGE_TIMEOUT)
+
+    def _select_links(self, site):
+        site.links = brochures.crawler.get_links(site.url, site.landing)
+
+    def _fetch_pages(self, site):
+        site.pages = brochures.crawler.fetch_pages(site.landing, site.links, site.key)
+
+    def _write(self, site):
+        return brochures.write_brochure(site.company, site.url, site.cache_key, site.pages)
+
+    def _finish(self, site, brochure=None, error=None, stage=None, cached=False):
+        seconds = time.perf_counter() - site.started
+        record = {"url": site.url, "company": site.company, "brochure": brochure, "cached": cached,
+                  "error": f"{type(error).__name__}: {error}" if error else None, "stage": stage,
+                  "seconds": round(seconds, 3), "stages": {name: round(value, 3) for name, value in site.stages.items()}}
+        with self.lock:
+            # The result is on disk before the checkpoint says so: a crash in between repeats the site, never loses it
+            self.output.write(json.dumps(record) + "\n")
+            self.output.flush()
+            if error is None:
+                self.checkpoint.write(site.key + "\n")
+                self.checkpoint.flush()
+                self.stats["cached" if cached else "written"] += 1
+                if not cached:
+                    self.site_latencies.append(seconds)
+            else:
+                self.stats["failed"] += 1
+            self.pending -= 1
+            self.idle.notify_all()
+        self.admission.release()
+        if error is None:
+            log.info("Brochure for %s %s in %.1fs", site.url, "from cache" if cached else "written", seconds)
+        else:
+            log.warning("No brochure for %s: %s failed: %s", site.url, stage, error)
+
+    def get_stats(self):
+        """
+        Returns:
+            dict: Sites written, cached, failed and skipped, elapsed seconds, sites per second, and the
+            count, p50, p95 and max seconds of each stage and of a whole site.
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            samples = {name: list(values) for name, values in self.latencies.items()}
+            samples["site"] = list(self.site_latencies)
+        stats["seconds"] = time.perf_counter() - self.started
+        done = stats["written"] + stats["cached"] + stats["failed"]
+        stats["sites_per_second"] = done / stats["seconds"] if stats["seconds"] else 0.0
+        stats["latency"] = {name: {"count": len(values), "p50": _percentile(values, 50), "p95": _percentile(values, 95),
+                                   "max": max(values) if values else None}
+                            for name, values in samples.items()}
+        return stats
+
+def print_report(stats):
+    print(f"{stats['written']} brochures written, {stats['cached']} from cache, {stats['failed']} failed, "
+          f"{stats['skipped']} skipped in {stats['seconds']:.1f}s: {stats['sites_per_second']:.2f} sites/s "
+          f"({stats['sites_per_second'] * 60:.0f} a minute)")
+    print(f"  {'stage':<10} {'count':>6} {'p50':>8} {'p95':>8} {'max':>8}")
+    for name, latency in stats["latency"].items():
+        if latency["count"]:
+            print(f"  {name:<10} {latency['count']:>6} {latency['p50']:>7.2f}s {latency['p95']:>7.2f}s {latency['max']:>7.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Write brochures for a list of websites")
+    parser.add_argument("urls", help="file with one url per line, optionally followed by the company name; - for stdin")
+    parser.add_argument("--output", default="brochures.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--checkpoint", help="file of finished sites to skip and extend (default: OUTPUT.checkpoint)")
+    for name, limit in STAGE_LIMITS.items():
+        parser.add_argument(f"--{name}-concurrency", type=int, default=limit, help=f"sites in the {name} stage at once")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="sites in the pipeline at once")
+    args = parser.parse_args()
+
+    limits = {name: getattr(args, f"{name}_concurrency") for name in STAGE_LIMITS}
+    pipeline = BrochurePipeline(args.output, args.checkpoint or args.output + ".checkpoint", limits, args.max_in_flight)
+    lines = sys.stdin if args.urls == "-" else open(args.urls, encoding="utf-8")
+    try:
+        pipeline.run(read_sites(lines))
+    except KeyboardInterrupt:
+        print("Interrupted: finishing the stages in progress; run again to resume", file=sys.stderr)
+        pipeline.stop()
+    finally:
+        pipeline.close()
+        print_report(pipeline.get_stats())
+
+if __name__ == "__main__":
+    main()
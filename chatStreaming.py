@@ -0,0 +1,141 @@
+# imports
+import os
+import asyncio
+
+# Streamed text is sent to the browser at most every FLUSH_INTERVAL seconds, or sooner once FLUSH_CHARS have piled up
+FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_MS", "50")) / 1000
+FLUSH_CHARS = int(os.getenv("STREAM_FLUSH_CHARS", "64"))
+
+class StreamedTurn:
+    """
+    Consumes a streamed chat completion, handing out text as it arrives while assembling any
+    tool calls from their deltas
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.tool_calls = []  # dicts in the shape the chat completions API expects
+        self.finish_reason = None
+
+    def consume(self, stream):
+        """
+        Yields each piece of text of the stream; tool call deltas are collected into self.tool_calls.
+        """
+        for chunk in stream:
+            text = self._add_chunk(chunk)
+            if text:
+                yield text
+
+    async def aconsume(self, stream):
+        """
+        Like consume, for an async stream.
+        """
+        async for chunk in stream:
+            text = self._add_chunk(chunk)
+            if text:
+                yield text
+
+    def _add_chunk(self, chunk):
+        if not chunk.choices:
+            return None
+        choice = chunk.choices[0]
+        delta = choice.delta
+        for tool_call_delta in delta.tool_calls or []:
+            self._add_tool_call_delta(tool_call_delta)
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+        if delta.content:
+            self.parts.append(delta.content)
+        return delta.content
+
+    @property
+    def content(self):
+        if len(self.parts) > 1:
+            self.parts[:] = ["".join(self.parts)]
+        return self.parts[0] if self.parts else ""
+
+    def _add_tool_call_delta(self, tool_call_delta):
+        while len(self.tool_calls) <= tool_call_delta.index:
+            self.tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+        tool_call = self.tool_calls[tool_call_delta.index]
+        if tool_call_delta.id:
+            tool_call["id"] = tool_call_delta.id
+        if tool_call_delta.function:
+            if tool_call_delta.function.name:
+                tool_call["function"]["name"] += tool_call_delta.function.name
+            if tool_call_delta.function.arguments:
+                tool_call["function"]["arguments"] += tool_call_delta.function.arguments
+
+    def message(self):
+        """
+        Returns the assistant message of this turn, to append to the conversation before the tool results.
+        """
+        message = {"role": "assistant", "content": self.content or None}
+        if self.tool_calls:
+            message["tool_calls"] = self.tool_calls
+        return message
+
+async def coalesce(texts, prefix="", interval=FLUSH_INTERVAL, max_chars=FLUSH_CHARS, deltas=False):
+    """
+    Batches an async stream of text pieces into fewer, larger updates: pieces are buffered and flushed
+    once max_chars have arrived or interval seconds after the first unflushed piece, even if the stream
+    stalls. The first piece is flushed straight away so the reply starts showing immediately.
+
+    Args:
+        texts: async iterable of str, e.g. StreamedTurn().aconsume(stream).
+        prefix (str): Text already shown, which the full-text updates continue from.
+        deltas (bool): Yield only the newly appended text instead of the full text so far.
+
+    Yields:
+        str: The full text so far (prefix included), or the appended text if deltas is set.
+    """
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+    pending = []
+    pending_chars = 0
+    timer = None
+    flushed = False
+    finished = False
+    error = None
+
+    async def pump():
+        nonlocal pending_chars, timer, finished, error
+        try:
+            async for piece in texts:
+                if not piece:
+                    continue
+                pending.append(piece)
+                pending_chars += len(piece)
+                if not flushed or pending_chars >= max_chars:
+                    ready.set()
+                elif timer is None:
+                    timer = loop.call_later(interval, ready.set)
+        except Exception as exception:
+            error = exception
+        finally:
+            finished = True
+            ready.set()
+
+    producer = asyncio.ensure_future(pump())
+    text = prefix
+    try:
+        while not finished or pending:
+            await ready.wait()
+            ready.clear()
+            if timer is not None:
+                timer.cancel()
+                timer = None
+            if pending:
+                delta = "".join(pending)
+                pending.clear()
+                pending_chars = 0
+                flushed = True
+                text += delta
+                yield delta if deltas else text
+        if error is not None:
+            raise error
+    finally:
+        if timer is not None:
+            timer.cancel()
+        # If the consumer went away mid-stream, this stops the producer and closes the upstream stream
+        producer.cancel()
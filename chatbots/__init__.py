@@ -0,0 +1,14 @@
+"""
+Single entry point for the chatbots: python -m chatbots <name>
+"""
+
+# Bot name -> module that defines its chat handler and launch()
+BOTS = {
+    "chat": "openaiGradioChatbot",
+    "sales": "openaiGradioChatbotSalesAssistant",
+    "airline": "openaiGradioChatbotAirlineAssistant",
+    "voice": "openaiGradioChatbotAirlineAssistantVoice",
+    "website": "openaiGradioChatbotRAGWebsiteAssitant",
+    "social": "openaiGradioChatbotRAGWebsiteAssitantSocial",
+    "brochure": "openaiGradioChatbotRAGWebsiteBrochure",
+}
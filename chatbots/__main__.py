@@ -0,0 +1,68 @@
+# imports
+import os
+import sys
+import time
+import argparse
+import importlib
+import subprocess
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chatbots import BOTS
+
+def import_breakdown(module, top=15):
+    """
+    Imports module in a fresh interpreter with -X importtime and sums the time spent per top-level package.
+
+    Returns:
+        tuple: (total seconds, [(package, seconds), ...] slowest first, error message or None)
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root, capture_output=True, text=True,
+    )
+    per_package = defaultdict(int)
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        per_package[name.split(".")[0]] += int(self_us)
+        total += int(self_us)
+    slowest = sorted(per_package.items(), key=lambda item: -item[1])[:top]
+    error = result.stderr.strip().splitlines()[-1] if result.returncode else None
+    return total / 1e6, [(package, us / 1e6) for package, us in slowest], error
+
+def report(name):
+    module = BOTS[name]
+    total, slowest, error = import_breakdown(module)
+    print(f"Startup report for {name} ({module})")
+    if error:
+        print(f"  import failed ({error}); times below cover what loaded before the error")
+    print(f"  total import time: {total:.3f}s")
+    for package, seconds in slowest:
+        print(f"  {package:<30} {seconds:7.3f}s  {seconds / total:6.1%}" if total else f"  {package}")
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m chatbots", description="Launch one of the chatbots.")
+    parser.add_argument("name", choices=sorted(BOTS), help="which bot to launch")
+    parser.add_argument("--report", action="store_true",
+                        help="print an import-time breakdown of the bot's start-up instead of launching it")
+    parser.add_argument("--metrics-port", type=int,
+                        help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics (default: METRICS_PORT)")
+    args = parser.parse_args()
+
+    if args.report:
+        report(args.name)
+        return
+
+    start = time.perf_counter()
+    bot = importlib.import_module(BOTS[args.name])
+    print(f"{args.name} ready in {time.perf_counter() - start:.2f}s")
+    if args.metrics_port:
+        importlib.import_module("telemetry").start_metrics_server(args.metrics_port)
+    bot.launch()
+
+if __name__ == "__main__":
+    main()
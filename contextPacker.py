@@ -0,0 +1,109 @@
+# imports
+import re
+import logging
+from collections import Counter
+
+MIN_USEFUL_WORDS = 4   # chunks shorter than this (menu items, buttons) rank low
+FULL_VALUE_WORDS = 60  # chunks longer than this are not worth more for being longer
+
+log = logging.getLogger(__name__)
+
+_encodings = {}
+_warned = False
+
+def _encoding(model):
+    global _warned
+    if model not in _encodings:
+        encoding = None
+        try:
+            import tiktoken
+        except ImportError:
+            tiktoken = None
+        if tiktoken is not None:
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except Exception:
+                # Unknown model, or the encoding files can't be downloaded
+                try:
+                    encoding = tiktoken.get_encoding("o200k_base")
+                except Exception as error:
+                    if not _warned:
+                        log.warning("tiktoken encoding unavailable (%s), token counts are approximate", type(error).__name__)
+                        _warned = True
+        elif not _warned:
+            log.warning("tiktoken not installed, token counts are approximate")
+            _warned = True
+        _encodings[model] = encoding
+    return _encodings[model]
+
+def count_tokens(text, model):
+    """
+    Counts the tokens text uses for model, with the model's own tokenizer when tiktoken is available.
+    Without it, a deliberately generous estimate is used so budgets are not overrun.
+    """
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(len(re.findall(r"\w+|[^\w\s]", text)), (len(text) + 2) // 3)
+
+def render_page(page, text):
+    return f"{page['type']}:\nWebpage Title:\n{page['title']}\nWebpage Contents:\n{text}\n\n"
+
+def _chunk_score(chunk, page_index, chunk_index):
+    words = len(chunk.split())
+    if words < MIN_USEFUL_WORDS:
+        value = 0.1 * words / MIN_USEFUL_WORDS
+    else:
+        value = min(words, FULL_VALUE_WORDS) / FULL_VALUE_WORDS
+    # Earlier pages (the landing page first) and earlier paragraphs on a page are usually more central
+    return value / (1 + 0.05 * page_index) / (1 + 0.02 * chunk_index)
+
+def pack_pages(pages, token_budget, model):
+    """
+    Packs scraped pages into a context of at most token_budget tokens.
+
+    Each page's text is split into paragraphs, paragraphs that repeat across pages (navigation, footers)
+    are dropped, and the most useful remaining paragraphs are kept in their original order until the
+    budget is full.
+
+    Args:
+        pages (list): dicts with type, title and text, in the order they should appear.
+        token_budget (int): The maximum number of tokens of the result.
+        model (str): The model whose tokenizer measures the budget.
+
+    Returns:
+        str: The packed pages.
+    """
+    chunked = [[line for line in page["text"].split("\n") if line.strip()] for page in pages]
+    occurrences = Counter(line for chunks in chunked for line in set(chunks))
+    candidates = []  # (score, page_index, chunk_index, tokens)
+    kept = []
+    for page_index, chunks in enumerate(chunked):
+        kept.append([False] * len(chunks))
+        for chunk_index, chunk in enumerate(chunks):
+            if occurrences[chunk] > 1 and len(pages) > 1:
+                continue
+            score = _chunk_score(chunk, page_index, chunk_index)
+            candidates.append((score, page_index, chunk_index, count_tokens(chunk + "\n", model)))
+
+    used = sum(count_tokens(render_page(page, ""), model) for page in pages)
+    for score, page_index, chunk_index, tokens in sorted(candidates, key=lambda c: -c[0]):
+        if used + tokens <= token_budget:
+            kept[page_index][chunk_index] = True
+            used += tokens
+
+    def render():
+        return "".join(
+            render_page(page, "\n".join(c for c, keep in zip(chunks, flags) if keep))
+            for page, chunks, flags in zip(pages, chunked, kept)
+        )
+
+    # Token counts are not exactly additive across joins, so trim the lowest ranked chunks if needed
+    result = render()
+    for score, page_index, chunk_index, tokens in sorted(candidates, key=lambda c: c[0]):
+        if count_tokens(result, model) <= token_budget:
+            break
+        if kept[page_index][chunk_index]:
+            kept[page_index][chunk_index] = False
+            result = render()
+    return result
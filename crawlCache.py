@@ -0,0 +1,188 @@
+# imports
+import os
+import re
+import json
+import hashlib
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Where the on-disk caches live
+CACHE_DIR = os.getenv("CHATBOT_CACHE_DIR", ".cache")
+DEFAULT_TTL = 6 * 60 * 60              # seconds an entry stays fresh
+DEFAULT_MEMORY_BYTES = 32 * 1024 * 1024  # byte cap of the in-memory tier
+DEFAULT_DISK_BYTES = 256 * 1024 * 1024   # byte cap of the on-disk tier
+
+_url = re.compile(r"https?://[^\s<>\"'()\[\]{}]+")
+
+def normalize_url(url):
+    """
+    Normalizes a url so that trivially different spellings share a cache entry.
+
+    Lowercases the scheme and host, defaults to https, drops default ports, fragments and
+    trailing slashes, and sorts the query parameters.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = "https://" + url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not (scheme == "http" and parts.port == 80 or scheme == "https" and parts.port == 443):
+        host += f":{parts.port}"
+    path = parts.path.rstrip("/")
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ""))
+
+def find_urls(text, limit=None):
+    """
+    Returns the distinct http(s) urls in text, in order and without trailing punctuation; the first
+    limit of them if limit is set.
+    """
+    urls = []
+    for match in _url.findall(text or ""):
+        url = match.rstrip(".,;:!?")
+        if url not in urls:
+            urls.append(url)
+    return urls[:limit]
+
+def content_hash(*parts):
+    """
+    Returns a stable sha256 hex digest of any JSON serializable parts, for use as a cache key.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+class CrawlCache:
+    """
+    A two-tier (memory + SQLite) cache with a TTL per entry and byte-capped LRU eviction.
+    Values must be JSON serializable.
+    """
+
+    def __init__(self, name, ttl=DEFAULT_TTL, memory_bytes=DEFAULT_MEMORY_BYTES,
+                 disk_bytes=DEFAULT_DISK_BYTES, path=None):
+        self.name = name
+        self.ttl = ttl
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()  # key -> (expires, size, value), least recently used first
+        self.memory_size = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0,
+                      "memory_evictions": 0, "disk_evictions": 0}
+        self.db = None
+        if disk_bytes:
+            path = path or os.path.join(CACHE_DIR, f"{name}.sqlite")
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, value TEXT, size INTEGER, expires REAL, last_access REAL)""")
+            self.db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            self.db.commit()
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None if it is missing or expired.
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                expires, size, value = entry
+                if expires > now:
+                    self.memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                self._drop_memory(key)
+                self.stats["expired"] += 1
+            if self.db is not None:
+                row = self.db.execute("SELECT value, size, expires FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    if row[2] > now:
+                        self.db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+                        self.db.commit()
+                        value = json.loads(row[0])
+                        self._put_memory(key, value, row[1], row[2])
+                        self.stats["disk_hits"] += 1
+                        return value
+                    self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self.db.commit()
+                    if entry is None:
+                        self.stats["expired"] += 1
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, value, ttl=None):
+        """
+        Stores value under key in both tiers, evicting least recently used entries to stay under the byte caps.
+        """
+        serialized = json.dumps(value)
+        size = len(serialized.encode("utf-8"))
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self._put_memory(key, value, size, expires)
+            if self.db is not None and size <= self.disk_bytes:
+                self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                                (key, serialized, size, expires, now))
+                self._evict_disk()
+                self.db.commit()
+
+    def invalidate(self, key):
+        with self.lock:
+            self._drop_memory(key)
+            if self.db is not None:
+                self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.memory_size = 0
+            if self.db is not None:
+                self.db.execute("DELETE FROM entries")
+                self.db.commit()
+
+    def get_stats(self):
+        """
+        Returns hit/miss/eviction counters and the current size of each tier.
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self.memory)
+            stats["memory_bytes"] = self.memory_size
+            if self.db is not None:
+                count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+                stats["disk_entries"] = count
+                stats["disk_bytes"] = total
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def _put_memory(self, key, value, size, expires):
+        self._drop_memory(key)
+        if size > self.memory_bytes:
+            return
+        self.memory[key] = (expires, size, value)
+        self.memory_size += size
+        while self.memory_size > self.memory_bytes:
+            _, (_, evicted_size, _) = self.memory.popitem(last=False)
+            self.memory_size -= evicted_size
+            self.stats["memory_evictions"] += 1
+
+    def _drop_memory(self, key):
+        entry = self.memory.pop(key, None)
+        if entry is not None:
+            self.memory_size -= entry[1]
+
+    def _evict_disk(self):
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.disk_bytes:
+            return
+        for key, size in self.db.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            if total <= self.disk_bytes:
+                break
+            self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            self.stats["disk_evictions"] += 1
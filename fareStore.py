@@ -0,0 +1,216 @@
+# imports
+import os
+import re
+import csv
+import logging
+import time
+import sqlite3
+import threading
+import unicodedata
+from bootstrap import lazy_import
+from crawlCache import CACHE_DIR
+
+# NumPy scores the fuzzy matches; it is only loaded with the first fare store
+np = lazy_import("numpy")
+
+# The fare table: origin,destination,price,aliases (an empty origin is the airline's default route,
+# aliases are |-separated alternative names of the destination)
+FARES_FILE = os.getenv("FARES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "fares.csv"))
+RELOAD_CHECK = 1.0     # seconds between checks of the fare file for changes
+FUZZY_THRESHOLD = 0.6  # Dice similarity of trigrams a misspelt city needs to be suggested
+MIN_LENGTH_RATIO = 0.75  # ... and the shorter of the two names at least this share of the longer one's length
+
+_separator = re.compile(r"[^\w]+")
+log = logging.getLogger(__name__)
+
+def normalize_city(name):
+    """
+    Lowercases, strips accents and punctuation: "São Paulo, BR" -> "sao paulo br".
+    """
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    return " ".join(_separator.sub(" ", name.lower()).split())
+
+def trigrams(name):
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class FareStore:
+    """
+    Fares loaded from a CSV file into SQLite, with an in-memory alias and trigram index of the city
+    names, so "London, UK" and "Tokio" find their fares and "Londn" gets London as a suggestion, never
+    its price. The file is reloaded when it changes.
+    """
+
+    def __init__(self, path=FARES_FILE, db_path=None):
+        self.path = path
+        self.db_path = db_path or os.path.join(CACHE_DIR, "fares.sqlite")
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.execute("PRAGMA mmap_size = 268435456")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS routes (
+            origin TEXT, destination TEXT, price TEXT, PRIMARY KEY (origin, destination)) WITHOUT ROWID""")
+        self.db.execute("CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, city TEXT) WITHOUT ROWID")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.commit()
+        self.signature = None
+        self.names = []        # every known spelling: cities and their aliases
+        self.cities = {}       # spelling -> city
+        self.postings = {}     # trigram -> array of indexes into names
+        self.gram_counts = None  # trigrams per name
+        self.lengths = None    # characters per name
+        self.checked = 0
+        self.version = None
+        self.reload()
+
+    def reload(self):
+        """
+        Imports the fare file into SQLite if it changed since the last import, then rebuilds the city index.
+        """
+        with self.lock:
+            signature = self._file_signature()
+            stored = self.db.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+            if signature and (stored is None or stored[0] != signature):
+                self._import(signature)
+            self.signature = signature
+            self.version = signature or (stored and stored[0])
+            self._build_index()
+            self.checked = time.monotonic()
+
+    def lookup(self, destination, origin=""):
+        """
+        Returns {"city", "price"} for the city destination names, or None if it names none; see suggest_city.
+        """
+        return self.lookup_many([destination], origin)[0]
+
+    def lookup_many(self, destinations, origin=""):
+        """
+        Batch lookup for questions about several cities: one query for all the matched cities.
+
+        Returns:
+            list: {"city", "price"} or None per destination, in order.
+        """
+        self._maybe_reload()
+        with self.lock:
+            origin = self.match_city(origin) or "" if origin else ""
+            cities = [self.match_city(destination) for destination in destinations]
+            wanted = sorted({city for city in cities if city})
+            prices = {}
+            if wanted:
+                placeholders = ",".join("?" * len(wanted))
+                rows = self.db.execute(
+                    f"SELECT destination, price FROM routes WHERE origin = ? AND destination IN ({placeholders})",
+                    [origin] + wanted).fetchall()
+                prices = dict(rows)
+        return [{"city": city, "price": prices[city]} if city in prices else None for city in cities]
+
+    def match_city(self, name):
+        """
+        Returns the city a user-typed name is a spelling or alias of ("London, UK" -> "london"), or None.
+        """
+        return self.cities.get(normalize_city(name))
+
+    def suggest_city(self, name):
+        """
+        Returns the city a name that matched none probably means, to ask the user about rather than to
+        price: the city its leading words name ("London, Ontario" -> "london"), or else the closest
+        spelling by trigram similarity ("Londn" -> "london"). None if no city is close enough.
+        """
+        self._maybe_reload()
+        with self.lock:
+            words = normalize_city(name).split()
+            for count in range(len(words) - 1, 0, -1):
+                city = self.cities.get(" ".join(words[:count]))
+                if city:
+                    return city
+            if not words:
+                return None
+            return self._fuzzy(" ".join(words)) or (self._fuzzy(words[0]) if len(words) > 1 else None)
+
+    def city_names(self):
+        self._maybe_reload()
+        return self.cities.keys()
+
+    def destinations(self, origin=""):
+        self._maybe_reload()
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT destination FROM routes WHERE origin = ?", (origin,))]
+
+    def _fuzzy(self, name):
+        query = trigrams(name)
+        postings = [self.postings[gram] for gram in query if gram in self.postings]
+        if not postings:
+            return None
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.names))
+        scores = 2 * shared / (len(query) + self.gram_counts)
+        # A name inside a longer one ("Londonderry", "East London") shares most of its trigrams with it
+        scores[np.minimum(self.lengths, len(name)) < MIN_LENGTH_RATIO * np.maximum(self.lengths, len(name))] = 0
+        best = int(scores.argmax())
+        return self.cities[self.names[best]] if scores[best] >= FUZZY_THRESHOLD else None
+
+    def _maybe_reload(self):
+        if time.monotonic() - self.checked < RELOAD_CHECK:
+            return
+        self.checked = time.monotonic()
+        if self._file_signature() != self.signature:
+            self.reload()
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return f"{os.path.abspath(self.path)}:{stat.st_mtime_ns}:{stat.st_size}"
+
+    def _import(self, signature):
+        with open(self.path, newline="", encoding="utf-8") as file:
+            rows = list(csv.DictReader(file))
+        routes = {}
+        aliases = {}
+        for row in rows:
+            destination = normalize_city(row["destination"])
+            origin = normalize_city(row.get("origin") or "")
+            routes[(origin, destination)] = row["price"].strip()
+            for name in (origin, destination):
+                if name:
+                    aliases.setdefault(name, name)
+            for alias in (row.get("aliases") or "").split("|"):
+                alias = normalize_city(alias)
+                if alias:
+                    aliases.setdefault(alias, destination)
+        with self.db:
+            self.db.execute("DELETE FROM routes")
+            self.db.execute("DELETE FROM aliases")
+            self.db.executemany("INSERT INTO routes VALUES (?, ?, ?)",
+                                ((origin, destination, price) for (origin, destination), price in routes.items()))
+            self.db.executemany("INSERT INTO aliases VALUES (?, ?)", aliases.items())
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (signature,))
+        log.info("Loaded %d fares and %d city names from %s", len(routes), len(aliases), self.path)
+
+    def _build_index(self):
+        self.cities = dict(self.db.execute("SELECT alias, city FROM aliases"))
+        self.names = list(self.cities)
+        postings = {}
+        gram_counts = np.zeros(len(self.names), dtype=np.float32)
+        for index, name in enumerate(self.names):
+            grams = trigrams(name)
+            gram_counts[index] = len(grams)
+            if len(name) < 4:
+                # Codes like "ber" only match exactly: as fuzzy targets they would pull in "bern"
+                continue
+            for gram in grams:
+                postings.setdefault(gram, []).append(index)
+        self.postings = {gram: np.array(indexes, dtype=np.int32) for gram, indexes in postings.items()}
+        self.gram_counts = gram_counts
+        self.lengths = np.array([len(name) for name in self.names], dtype=np.int32)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_fare_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FareStore()
+    return _store
@@ -0,0 +1,103 @@
+# imports
+import os
+import time
+import threading
+from crawlCache import CACHE_DIR, content_hash
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+class FileCache:
+    """
+    A content-addressed, disk-backed cache of generated media (images, audio clips) with a byte cap
+    and LRU eviction. Entries are handed out as file paths, so they go to Gradio without being decoded.
+    """
+
+    def __init__(self, name, suffix, max_bytes=DEFAULT_MAX_BYTES, companions=()):
+        self.directory = os.path.join(CACHE_DIR, name)
+        self.suffix = suffix
+        # Suffixes of further files an entry may have beside its main one; they are counted and evicted with it
+        self.companions = companions
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        os.makedirs(self.directory, exist_ok=True)
+        # key -> [size, last access], rebuilt from the files already on disk
+        self.entries = {}
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(suffix):
+                key = file_name[:-len(suffix)]
+                info = os.stat(os.path.join(self.directory, file_name))
+                self.entries[key] = [self._size(key), info.st_mtime]
+        self.total_bytes = sum(size for size, _ in self.entries.values())
+
+    def key(self, *parts):
+        return content_hash(*parts)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _files(self, key):
+        return [self.path(key)] + [os.path.join(self.directory, key + suffix) for suffix in self.companions]
+
+    def _size(self, key):
+        return sum(os.path.getsize(path) for path in self._files(key) if os.path.exists(path))
+
+    def get(self, key):
+        """
+        Returns the path of the cached file for key, or None.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or not os.path.exists(self.path(key)):
+                self.stats["misses"] += 1
+                return None
+            entry[1] = time.time()
+            self.stats["hits"] += 1
+        # Keep the recency across restarts
+        os.utime(self.path(key))
+        return self.path(key)
+
+    def put(self, key, data):
+        """
+        Stores data under key and returns its path, evicting least recently used files over the cap.
+        """
+        path = self.path(key)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+        self._account(key, self._size(key))
+        return path
+
+    def add(self, key):
+        """
+        Takes in the files the caller wrote for key itself (the main file last, as it marks the entry
+        complete) and returns the main file's path, evicting least recently used entries over the cap.
+        """
+        self._account(key, self._size(key))
+        return self.path(key)
+
+    def _account(self, key, size):
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries[key][0]
+            self.entries[key] = [size, time.time()]
+            self.total_bytes += size
+            for old_key, (old_size, _) in sorted(self.entries.items(), key=lambda item: item[1][1]):
+                if self.total_bytes <= self.max_bytes or old_key == key:
+                    break
+                del self.entries[old_key]
+                self.total_bytes -= old_size
+                self.stats["evictions"] += 1
+                for path in self._files(old_key):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, entries=len(self.entries), bytes=self.total_bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,193 @@
+# imports
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from crawlCache import content_hash
+from contextPacker import count_tokens
+
+log = logging.getLogger(__name__)
+
+KEEP_TURNS = 6              # most recent turns sent verbatim
+MAX_RECENT_TOKENS = 3000    # older verbatim turns are folded into the summary beyond this
+FOLD_TURNS = 4              # turns past the verbatim window that start a fold into the summary
+FOLD_TOKENS = 1500          # ... or tokens of them, whichever comes first
+MAX_OVERFLOW_TOKENS = 4000  # past this, a turn waits for the fold instead of sending the turns verbatim
+STUB_TOKENS = 200           # tool results in history larger than this are stubbed
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_MAX_TOKENS = 400
+MAX_SESSIONS = 1024         # running summaries kept in memory
+
+summary_system_prompt = "You maintain a running summary of a conversation between a user and an assistant. \
+You are given the current summary and the turns that happened after it. Reply with the updated summary only: \
+keep every fact, number, URL, name and decision the assistant may need later, drop pleasantries, \
+and stay under 300 words."
+
+@lru_cache(maxsize=8192)
+def _content_tokens(content, model):
+    return count_tokens(content, model)
+
+def message_tokens(message, model):
+    """
+    Tokens a message costs in a prompt, including the per-message overhead of the chat format.
+    """
+    content = message.get("content")
+    return 4 + (_content_tokens(content, model) if isinstance(content, str) else 0)
+
+def prompt_tokens(messages, model):
+    return sum(message_tokens(message, model) for message in messages) + 3
+
+def split_turns(history):
+    """
+    Splits a history into turns, each starting with a user message.
+    """
+    turns, current = [], []
+    for message in history:
+        if message.get("role") == "user" and current:
+            turns.append(current)
+            current = []
+        current.append(message)
+    if current:
+        turns.append(current)
+    return turns
+
+def _transcript(messages):
+    return "\n".join(f"{message['role']}: {message['content']}" for message in messages
+                     if isinstance(message.get("content"), str))
+
+async def summarize_with_model(previous_summary, messages, session):
+    from asyncChat import complete
+    user_prompt = f"Current summary:\n{previous_summary or '(none yet)'}\n\nNew turns:\n{_transcript(messages)}"
+    response = await complete(session, model=SUMMARY_MODEL, max_tokens=SUMMARY_MAX_TOKENS, messages=[
+        {"role": "system", "content": summary_system_prompt},
+        {"role": "user", "content": user_prompt},
+    ])
+    return response.choices[0].message.content
+
+class HistoryManager:
+    """
+    Keeps prompts about the same size however long a conversation gets: the last turns are sent verbatim,
+    older turns are folded into a running summary that is updated incrementally, and finished tool results
+    are replaced by short stubs.
+
+    Turns that leave the verbatim window are sent verbatim after the summary until there are enough of
+    them to be worth a summary call; they are then folded in one batch, in the background, so the reply
+    doesn't wait for it. A turn only waits for a fold when the unsummarized turns outgrow max_overflow_tokens.
+    """
+
+    def __init__(self, model, keep_turns=KEEP_TURNS, max_recent_tokens=MAX_RECENT_TOKENS,
+                 summarize=summarize_with_model, fold_turns=FOLD_TURNS, fold_tokens=FOLD_TOKENS,
+                 max_overflow_tokens=MAX_OVERFLOW_TOKENS):
+        """
+        Args:
+            model (str): The model the prompts are for; its tokenizer measures them.
+            keep_turns (int): How many of the latest turns are sent verbatim.
+            max_recent_tokens (int): Fewer turns are kept verbatim if they would cost more than this.
+            summarize: async function (previous_summary, new_messages, session) -> updated summary.
+            fold_turns (int): Turns past the verbatim window that start a background fold.
+            fold_tokens (int): Tokens of turns past the verbatim window that start a background fold.
+            max_overflow_tokens (int): Beyond this many tokens of unsummarized turns, compact waits for the fold.
+        """
+        self.model = model
+        self.keep_turns = keep_turns
+        self.max_recent_tokens = max_recent_tokens
+        self.summarize = summarize
+        self.fold_turns, self.fold_tokens = fold_turns, fold_tokens
+        self.max_overflow_tokens = max_overflow_tokens
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()  # session -> (messages folded, hash of them, summary)
+        self.folds = {}                # session -> fold task in progress
+        self.stats = {"summaries": 0, "incremental": 0, "background": 0, "waited": 0}
+
+    async def compact(self, history, session="anonymous"):
+        """
+        Returns the messages to send in place of history: a summary system message (if any turns were
+        folded) followed by the turns not in it.
+        """
+        # Tool results of the turn in progress live in the caller's messages, so any in history are stale
+        turns = [[self._stub(message) for message in turn] for turn in split_turns(history)]
+        if not turns:
+            # A cleared chat keeps its session id; its old summary doesn't apply and is left alone
+            return []
+        keep = min(self.keep_turns, len(turns))
+        while keep > 1 and self._tokens(m for turn in turns[-keep:] for m in turn) > self.max_recent_tokens:
+            keep -= 1
+        flat = [message for turn in turns for message in turn]
+        starts = [0]
+        for turn in turns[:-1]:
+            starts.append(starts[-1] + len(turn))
+        window = starts[len(turns) - keep]
+
+        state = self._state(flat, starts[-1], session)
+        folded = state[0] if state else 0
+        tokens = self._tokens(flat[folded:window])
+        if tokens > self.max_overflow_tokens:
+            # Too far behind to keep sending verbatim, e.g. the background fold failed or is still running
+            self.stats["waited"] += 1
+            await self._wait_for_fold(session)
+            state = self._state(flat, starts[-1], session)
+            if self._tokens(flat[state[0] if state else 0:window]) > self.max_overflow_tokens:
+                state = await self._fold(flat[:window], state, session)
+        elif folded < window and (tokens >= self.fold_tokens or
+                                  sum(folded <= start < window for start in starts) >= self.fold_turns):
+            self._fold_later(flat[:window], state, session)
+
+        if not state:
+            return flat
+        # Turns already in the summary stay there even if the verbatim window could hold them again
+        return [{"role": "system", "content": f"Summary of the earlier conversation:\n{state[2]}"}] + flat[state[0]:]
+
+    def _tokens(self, messages):
+        return sum(message_tokens(message, self.model) for message in messages)
+
+    def _stub(self, message):
+        if message.get("role") != "tool" or message_tokens(message, self.model) <= STUB_TOKENS:
+            return message
+        return dict(message, content="[Earlier tool result omitted; call the tool again if it is needed.]")
+
+    def _state(self, flat, last, session):
+        # The session's summary, if it covers a prefix of this history that ends before last
+        with self.lock:
+            state = self.sessions.get(session)
+        if state and not (state[0] <= last and state[1] == content_hash(_transcript(flat[:state[0]]))):
+            return None
+        return state
+
+    def _fold_later(self, old, state, session):
+        task = self.folds.get(session)
+        if task is not None and not task.done():
+            return
+        self.stats["background"] += 1
+        task = asyncio.get_running_loop().create_task(self._fold(old, state, session))
+        self.folds[session] = task
+        task.add_done_callback(lambda done: self._folded(session, done))
+
+    def _folded(self, session, task):
+        if self.folds.get(session) is task:
+            del self.folds[session]
+        if not task.cancelled() and task.exception() is not None:
+            log.warning("Could not fold turns into the summary of %s: %r", session, task.exception())
+
+    async def _wait_for_fold(self, session):
+        task = self.folds.get(session)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            return
+        # A failed fold is retried by the caller, which then reports the error
+        await asyncio.wait([task])
+
+    async def _fold(self, old, state, session):
+        previous, new = "", old
+        if state:
+            # Only the turns that left the verbatim window since last time need folding in
+            previous, new = state[2], old[state[0]:]
+            self.stats["incremental"] += 1
+        summary = await self.summarize(previous, new, session)
+        self.stats["summaries"] += 1
+        state = (len(old), content_hash(_transcript(old)), summary)
+        with self.lock:
+            self.sessions[session] = state
+            self.sessions.move_to_end(session)
+            while len(self.sessions) > MAX_SESSIONS:
+                self.sessions.popitem(last=False)
+        return state
@@ -0,0 +1,165 @@
+# imports
+import codecs
+from html.parser import HTMLParser
+
+MAX_BYTES = 5 * 1024 * 1024   # stop reading a response after this many bytes
+MAX_TEXT_CHARS = 200_000      # stop collecting visible text after this many characters
+CHUNK_SIZE = 64 * 1024
+
+# Elements whose contents are not visible text
+IGNORED_TAGS = {"script", "style", "img", "input"}
+# Elements that never have contents, so they never open an ignored subtree
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+class PageExtractor(HTMLParser):
+    """
+    A single pass, event driven extractor that collects the title, visible body text and links of a page
+    without building a document tree. Feed it text with feed() and call close() at the end.
+    """
+
+    def __init__(self, max_text_chars=MAX_TEXT_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.max_text_chars = max_text_chars
+        self.title = None
+        self.seen_title = False
+        self.in_title = False
+        self.title_parts = []
+        self.body_depth = 0
+        self.seen_body = False
+        self.ignored_depth = 0
+        self.pending = []
+        self.text_parts = []
+        self.text_chars = 0
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag == "a":
+            self._add_link(attrs)
+        if tag in VOID_TAGS:
+            return
+        if self.ignored_depth or (tag in IGNORED_TAGS and self.body_depth):
+            self.ignored_depth += 1
+        elif tag == "body":
+            self.body_depth += 1
+            self.seen_body = True
+        elif tag == "title" and not self.seen_title:
+            self.in_title = True
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush()
+        if tag == "a":
+            self._add_link(attrs)
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag in VOID_TAGS:
+            return
+        if self.ignored_depth:
+            self.ignored_depth -= 1
+        elif tag == "body" and self.body_depth:
+            self.body_depth -= 1
+        elif tag == "title" and self.in_title:
+            self._finish_title()
+
+    def handle_data(self, data):
+        # A text node can arrive in several pieces when it straddles two feed() calls
+        self.pending.append(data)
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def close(self):
+        super().close()
+        self._flush()
+        if self.in_title:
+            self._finish_title()
+
+    def _add_link(self, attrs):
+        href = dict(attrs).get("href")
+        if href and not self.ignored_depth:
+            self.links.append(href)
+
+    def _flush(self):
+        if not self.pending:
+            return
+        data = "".join(self.pending)
+        self.pending = []
+        if self.in_title:
+            self.title_parts.append(data)
+        if not self.body_depth or self.ignored_depth or self.text_chars >= self.max_text_chars:
+            return
+        data = data.strip()
+        if data:
+            data = data[:self.max_text_chars - self.text_chars]
+            self.text_parts.append(data)
+            self.text_chars += len(data)
+
+    def _finish_title(self):
+        self.in_title = False
+        self.seen_title = True
+        # Like BeautifulSoup's title.string: None unless the title holds exactly one string
+        self.title = self.title_parts[0] if len(self.title_parts) == 1 else None
+
+    def get_page(self):
+        """
+        Returns the page as a dict with title, text and links, in the same shape Website uses.
+        """
+        return {
+            "title": self.title if self.seen_title else "No title found",
+            "text": "\n".join(self.text_parts) if self.seen_body else "",
+            "links": self.links,
+        }
+
+def encoding_from_content_type(content_type):
+    for param in (content_type or "").split(";")[1:]:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "charset" and value:
+            try:
+                return codecs.lookup(value.strip("\"'")).name
+            except LookupError:
+                break
+    return "utf-8"
+
+def read_body(chunks, max_bytes=MAX_BYTES):
+    """
+    Reads a streamed body into bytes, stopping after max_bytes.
+
+    Args:
+        chunks (iterable): The body as an iterable of bytes, e.g. response.iter_content().
+        max_bytes (int): Stop reading after this many bytes.
+    """
+    parts, read = [], 0
+    for chunk in chunks:
+        parts.append(chunk[:max_bytes - read])
+        read += len(parts[-1])
+        if read >= max_bytes:
+            break
+    return b"".join(parts)
+
+def extract_page(chunks, encoding="utf-8", max_bytes=MAX_BYTES, max_text_chars=MAX_TEXT_CHARS):
+    """
+    Streams a page body through PageExtractor.
+
+    Args:
+        chunks (iterable): The body as an iterable of bytes, e.g. response.iter_content().
+        encoding (str): The character encoding of the body.
+        max_bytes (int): Stop reading after this many bytes.
+        max_text_chars (int): Stop collecting text after this many characters.
+
+    Returns:
+        dict: The page title, visible text and links.
+    """
+    extractor = PageExtractor(max_text_chars=max_text_chars)
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    read = 0
+    for chunk in chunks:
+        if read + len(chunk) > max_bytes:
+            chunk = chunk[:max_bytes - read]
+        read += len(chunk)
+        extractor.feed(decoder.decode(chunk))
+        if read >= max_bytes:
+            break
+    extractor.feed(decoder.decode(b"", final=True))
+    extractor.close()
+    return extractor.get_page()
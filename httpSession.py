@@ -0,0 +1,131 @@
+# imports
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util import make_headers
+from crawlCache import CrawlCache
+
+POOL_CONNECTIONS = 32  # number of hosts to keep pools for
+POOL_MAXSIZE = 8       # keep-alive connections kept per host
+VALIDATOR_TTL = 7 * 24 * 60 * 60          # seconds a page is kept for revalidation
+VALIDATOR_MEMORY_BYTES = 16 * 1024 * 1024  # byte cap of the validators kept in memory
+VALIDATOR_DISK_BYTES = 128 * 1024 * 1024   # byte cap of the validators kept on disk
+
+# Negotiates gzip/deflate, plus br and zstd when the decoders are installed
+ACCEPT_ENCODING = make_headers(accept_encoding=True)["accept-encoding"]
+
+_stats = {"requests": 0, "connections_opened": 0, "not_modified": 0}
+_stats_lock = threading.Lock()
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def get_stats():
+    """
+    Returns the HTTP counters since start-up.
+
+    Returns:
+        dict: requests sent, connections opened and reused, and 304 Not Modified responses.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["connections_reused"] = max(stats["requests"] - stats["connections_opened"], 0)
+    return stats
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count("connections_opened")
+        return super()._new_conn()
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count("connections_opened")
+        return super()._new_conn()
+
+class _CountingAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+class ValidatorStore:
+    """
+    ETag / Last-Modified values and the parsed page they belong to, by url, in a byte-capped LRU cache
+    with a TTL: pages not fetched for a while make room for new ones.
+    """
+
+    def __init__(self, name="http_validators", ttl=VALIDATOR_TTL, memory_bytes=VALIDATOR_MEMORY_BYTES,
+                 disk_bytes=VALIDATOR_DISK_BYTES):
+        self.cache = CrawlCache(name, ttl=ttl, memory_bytes=memory_bytes, disk_bytes=disk_bytes)
+
+    def get(self, url):
+        entry = self.cache.get(url)
+        if entry is None:
+            return None, None, None
+        return entry["etag"], entry["last_modified"], entry["page"]
+
+    def put(self, url, etag, last_modified, page):
+        self.cache.put(url, {"etag": etag, "last_modified": last_modified, "page": page})
+
+_session = None
+_store = None
+_init_lock = threading.Lock()
+
+def get_session():
+    global _session
+    with _init_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = _CountingAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        return _session
+
+def get_validator_store():
+    global _store
+    with _init_lock:
+        if _store is None:
+            _store = ValidatorStore()
+        return _store
+
+def conditional_get(url, headers=None, timeout=None, stream=False):
+    """
+    Fetches a url over the shared pooled session, revalidating it if we have seen it before.
+
+    Args:
+        url (str): The URL to fetch.
+        headers (dict): Extra request headers.
+        timeout (float): Seconds allowed for the request.
+        stream (bool): Leave the body unread so it can be consumed with iter_content().
+
+    Returns:
+        tuple: (response, page). page is the stored parse result when the server answered
+        304 Not Modified, otherwise None and the caller should parse the response.
+    """
+    etag, last_modified, page = get_validator_store().get(url)
+    request_headers = dict(headers or {})
+    if page is not None:
+        if etag:
+            request_headers["If-None-Match"] = etag
+        if last_modified:
+            request_headers["If-Modified-Since"] = last_modified
+    _count("requests")
+    response = get_session().get(url, headers=request_headers, timeout=timeout, stream=stream)
+    if response.status_code == 304 and page is not None:
+        _count("not_modified")
+        return response, page
+    return response, None
+
+def remember(url, response, page):
+    """
+    Stores the validators of a response together with its parsed page, if the server sent any.
+    """
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if response.ok and (etag or last_modified):
+        get_validator_store().put(url, etag, last_modified, page)
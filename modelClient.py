@@ -0,0 +1,420 @@
+# imports
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+import email.utils
+from collections import deque
+from functools import partial
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextPacker import count_tokens
+from telemetry import Counter, METRICS
+
+log = logging.getLogger(__name__)
+
+# Per-model budgets, shared by every session and by the sync and async clients; unset or 0 means no
+# local limit, leaving it to the API's own. MODEL_RATE_LIMITS sets them per model as JSON, e.g.
+# {"dall-e-3": {"rpm": 7}, "gpt-4o-mini": {"rpm": 5000, "tpm": 4000000}}
+DEFAULT_RPM = float(os.getenv("MODEL_RPM", "0"))
+DEFAULT_TPM = float(os.getenv("MODEL_TPM", "0"))
+RATE_LIMITS = json.loads(os.getenv("MODEL_RATE_LIMITS", "{}"))
+BURST_SECONDS = 10          # a bucket holds this many seconds of its budget
+COMPLETION_ESTIMATE = 500   # reply tokens reserved for a completion without max_tokens; corrected from its usage
+
+MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "4"))
+BACKOFF_BASE = 0.5          # seconds; the first retry waits up to this long, doubling after each
+BACKOFF_CAP = 20            # longest backoff between two attempts
+MAX_RETRY_AFTER = 30        # a longer Retry-After from the API fails the call instead of stalling the user
+RETRY_STATUSES = {408, 409, 429}  # and every 5xx
+
+# Hedging: an idempotent non-streaming call still running after the HEDGE_PERCENTILE latency of recent
+# calls of its model gets a duplicate request, and the first answer wins. Every duplicate is billed in full,
+# so it is off unless MODEL_HEDGING=1 trades up to HEDGE_BUDGET more calls for a shorter tail.
+HEDGING = os.getenv("MODEL_HEDGING", "0") == "1"
+HEDGED_OPERATIONS = {"chat", "embeddings"}  # not images or speech, whose duplicates cost the most
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20      # calls of a model to see before hedging it
+HEDGE_BUDGET = 0.05         # at most this share of calls get a duplicate
+LATENCY_WINDOW = 200        # recent calls the percentile is taken over
+
+REQUEST_TIMEOUT = float(os.getenv("MODEL_TIMEOUT", "60"))  # seconds; the SDK's own default is 10 minutes
+
+retries_total = Counter("chatbot_model_retries_total", "Model calls retried, by cause", ("model", "reason"))
+hedges_total = Counter("chatbot_model_hedges_total", "Duplicate requests sent for slow model calls, and won",
+                       ("model", "outcome"))
+throttled_seconds_total = Counter("chatbot_model_throttled_seconds_total",
+                                  "Time model calls waited for their model's rate limit", ("model",))
+METRICS.extend([retries_total, hedges_total, throttled_seconds_total])
+
+class TokenBucket:
+    """
+    A thread-safe token bucket that callers reserve from: reserve takes the tokens at once, letting the
+    level go below zero, and returns how long the caller must wait before using them. Callers are
+    therefore served in the order they reserved, whether they sleep in a thread or in the event loop.
+    """
+
+    def __init__(self, rate, capacity):
+        """
+        Args:
+            rate (float): Tokens added per second; None for no limit, where only a pause holds callers back.
+            capacity (float): Most tokens the bucket holds, i.e. the largest burst.
+        """
+        self.rate, self.capacity = rate, capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self, amount):
+        """
+        Returns:
+            float: Seconds to wait before going ahead.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if self.rate is None:
+                return max(self.paused_until - now, 0.0)
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            # A request larger than the bucket would never fit; it waits for a full bucket instead
+            self.level -= min(amount, self.capacity)
+            return max(-self.level / self.rate, self.paused_until - now, 0.0)
+
+    def refund(self, amount):
+        # Negative amounts charge for more than was reserved
+        with self.lock:
+            if self.rate is not None:
+                self.level = min(self.capacity, self.level + amount)
+
+    def pause(self, seconds):
+        """
+        Makes every reservation wait at least seconds from now, e.g. after the API said Retry-After.
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+_buckets = {}
+_latencies = {}
+_hedges = {"calls": 0, "hedged": 0}
+_state_lock = threading.Lock()
+
+def get_buckets(model):
+    """
+    Returns:
+        tuple: (requests bucket, tokens bucket or None) of model.
+    """
+    with _state_lock:
+        if model not in _buckets:
+            limits = RATE_LIMITS.get(model, {})
+            rpm, tpm = limits.get("rpm", DEFAULT_RPM), limits.get("tpm", DEFAULT_TPM)
+            # Kept without a limit too, so an exhausted quota can still pause the model
+            requests = TokenBucket(rpm / 60, max(1.0, rpm / 60 * BURST_SECONDS)) if rpm else TokenBucket(None, None)
+            tokens = TokenBucket(tpm / 60, max(1.0, tpm / 60 * BURST_SECONDS)) if tpm else None
+            _buckets[model] = requests, tokens
+        return _buckets[model]
+
+def estimate_tokens(operation, kwargs):
+    """
+    The tokens a call is expected to use, reserved before it is sent.
+    """
+    model = kwargs.get("model", "")
+    if operation == "chat":
+        prompt = 0
+        for message in kwargs.get("messages", []):
+            content = message.get("content") if isinstance(message, dict) else getattr(message, "content", None)
+            prompt += 4 + (count_tokens(content if isinstance(content, str) else json.dumps(content), model)
+                           if content else 0)
+        return prompt + (kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or COMPLETION_ESTIMATE)
+    if operation == "embeddings":
+        texts = kwargs.get("input", [])
+        return sum(count_tokens(text, model) for text in ([texts] if isinstance(texts, str) else texts))
+    return 0
+
+def reserve(model, tokens):
+    """
+    Reserves one request and tokens of model's budgets.
+
+    Returns:
+        float: Seconds to wait before sending the request.
+    """
+    requests, token_bucket = get_buckets(model)
+    delay = requests.reserve(1)
+    if token_bucket is not None and tokens:
+        delay = max(delay, token_bucket.reserve(tokens))
+    if delay:
+        throttled_seconds_total.inc(model, amount=delay)
+    return delay
+
+def settle(model, reserved, usage):
+    # Corrects the token budget with what the call really used
+    total = getattr(usage, "total_tokens", None)
+    token_bucket = get_buckets(model)[1]
+    if token_bucket is not None and total is not None and reserved:
+        token_bucket.refund(reserved - total)
+
+def record_latency(model, operation, seconds):
+    with _state_lock:
+        samples = _latencies.get((model, operation))
+        if samples is None:
+            samples = _latencies[(model, operation)] = deque(maxlen=LATENCY_WINDOW)
+        samples.append(seconds)
+        _hedges["calls"] += 1
+
+def hedge_delay(model, operation):
+    """
+    Returns:
+        float: Seconds after which a call deserves a duplicate, or None if it should not be hedged.
+    """
+    with _state_lock:
+        samples = sorted(_latencies.get((model, operation), ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * HEDGE_PERCENTILE / 100))]
+
+def take_hedge(model):
+    # Hedges are budgeted, so a slow upstream is not answered with twice the load
+    with _state_lock:
+        if _hedges["hedged"] >= HEDGE_BUDGET * _hedges["calls"]:
+            return False
+        _hedges["hedged"] += 1
+    hedges_total.inc(model, "sent")
+    return True
+
+def _retry_after(headers):
+    for header, divisor in (("retry-after-ms", 1000), ("retry-after", 1)):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return float(value) / divisor
+        except ValueError:
+            date = email.utils.parsedate_tz(value)
+            if date is not None:
+                return max(0.0, email.utils.mktime_tz(date) - time.time())
+    return None
+
+def backoff(model, error, attempt):
+    """
+    Decides whether a failed call is retried.
+
+    Returns:
+        float: Seconds to wait before the next attempt, or None to give up and raise error.
+    """
+    from openai import APIStatusError, APIConnectionError
+    if attempt >= MAX_RETRIES:
+        return None
+    retry_after = None
+    exhausted = False
+    if isinstance(error, APIStatusError):
+        if error.status_code not in RETRY_STATUSES and error.status_code < 500:
+            return None
+        reason = str(error.status_code)
+        headers = error.response.headers
+        retry_after = _retry_after(headers)
+        exhausted = "0" in (headers.get("x-ratelimit-remaining-requests"), headers.get("x-ratelimit-remaining-tokens"))
+    elif isinstance(error, APIConnectionError):
+        reason = "timeout" if "Timeout" in type(error).__name__ else "connection"
+    else:
+        return None
+    if retry_after is not None and retry_after > MAX_RETRY_AFTER:
+        return None
+    # Full jitter, so sessions that failed together don't retry together
+    delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        # Up to a fifth later than asked, which spreads the retries without doubling short waits
+        delay = retry_after * random.uniform(1, 1.2)
+    if exhausted:
+        # The model's quota is used up, so the whole budget waits, not just this call: the other
+        # sessions would only hit the same limit
+        get_buckets(model)[0].pause(delay)
+    retries_total.inc(model, reason)
+    log.info("Retrying %s in %.2fs after %s (attempt %d)", model, delay, reason, attempt + 1)
+    return delay
+
+class ModelClient:
+    """
+    Wraps the synchronous OpenAI client so every chat.completions.create, images.generate,
+    audio.speech.create and embeddings.create call is rate limited per model, retried on 429s, 5xx
+    and connection errors with jittered backoff that honours Retry-After, and, for idempotent
+    non-streaming calls, hedged with a duplicate request when it is slower than usual.
+    Anything else is passed through to the wrapped client.
+    """
+
+    def __init__(self, client, hedging=HEDGING, max_workers=32):
+        """
+        Args:
+            client: An openai.OpenAI client, best created with max_retries=0 so retries happen only here.
+            hedging (bool): Whether slow idempotent calls get a duplicate request.
+        """
+        self.client = client
+        self.hedging = hedging
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=partial(self.call, "chat", client.chat.completions.create)))
+        self.images = SimpleNamespace(generate=partial(self.call, "images", client.images.generate))
+        self.audio = SimpleNamespace(speech=SimpleNamespace(
+            create=partial(self.call, "speech", client.audio.speech.create)))
+        self.embeddings = SimpleNamespace(create=partial(self.call, "embeddings", client.embeddings.create))
+
+    def __getattr__(self, attribute):
+        return getattr(self.client, attribute)
+
+    def call(self, operation, function, **kwargs):
+        model = kwargs.get("model", operation)
+        reserved = estimate_tokens(operation, kwargs)
+        hedged = self.hedging and operation in HEDGED_OPERATIONS and not kwargs.get("stream")
+        attempt = 0
+        while True:
+            try:
+                if hedged:
+                    return self._hedged(model, operation, function, kwargs, reserved)
+                return self._attempt(model, operation, function, kwargs, reserved)
+            except Exception as error:
+                delay = backoff(model, error, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+    def _attempt(self, model, operation, function, kwargs, reserved):
+        delay = reserve(model, reserved)
+        if delay:
+            time.sleep(delay)
+        start = time.perf_counter()
+        response = function(**kwargs)
+        if not kwargs.get("stream"):
+            record_latency(model, operation, time.perf_counter() - start)
+            settle(model, reserved, getattr(response, "usage", None))
+        return response
+
+    def _hedged(self, model, operation, function, kwargs, reserved):
+        delay = hedge_delay(model, operation)
+        if delay is None:
+            return self._attempt(model, operation, function, kwargs, reserved)
+        attempt = partial(contextvars.copy_context().run, self._attempt, model, operation, function, kwargs, reserved)
+        primary = self.executor.submit(attempt)
+        if wait([primary], timeout=delay).done or not take_hedge(model):
+            return primary.result()
+        hedge = self.executor.submit(attempt)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        hedges_total.inc(model, "won")
+                    # The other request can't be recalled from its thread; its answer is dropped
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+class _SettledStream:
+    """
+    Passes a streamed completion through and corrects the token budget from its final usage chunk.
+    """
+
+    def __init__(self, stream, model, reserved):
+        self.stream, self.model, self.reserved = stream, model, reserved
+
+    def __getattr__(self, attribute):
+        return getattr(self.stream, attribute)
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            if getattr(chunk, "usage", None):
+                settle(self.model, self.reserved, chunk.usage)
+            yield chunk
+
+class AsyncModelClient:
+    """
+    The same policy as ModelClient for the async client. A streamed completion is retried only while
+    it is being opened, before any of it reached the caller, and is never hedged.
+    """
+
+    def __init__(self, client, hedging=HEDGING):
+        """
+        Args:
+            client: An openai.AsyncOpenAI client, best created with max_retries=0.
+            hedging (bool): Whether slow idempotent calls get a duplicate request.
+        """
+        self.client = client
+        self.hedging = hedging
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=partial(self.call, "chat", client.chat.completions.create)))
+        self.images = SimpleNamespace(generate=partial(self.call, "images", client.images.generate))
+        self.audio = SimpleNamespace(speech=SimpleNamespace(
+            create=partial(self.call, "speech", client.audio.speech.create)))
+        self.embeddings = SimpleNamespace(create=partial(self.call, "embeddings", client.embeddings.create))
+
+    def __getattr__(self, attribute):
+        return getattr(self.client, attribute)
+
+    async def call(self, operation, function, **kwargs):
+        model = kwargs.get("model", operation)
+        reserved = estimate_tokens(operation, kwargs)
+        hedged = self.hedging and operation in HEDGED_OPERATIONS and not kwargs.get("stream")
+        attempt = 0
+        while True:
+            try:
+                if hedged:
+                    return await self._hedged(model, operation, function, kwargs, reserved)
+                return await self._attempt(model, operation, function, kwargs, reserved)
+            except Exception as error:
+                delay = backoff(model, error, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, model, operation, function, kwargs, reserved):
+        delay = reserve(model, reserved)
+        if delay:
+            await asyncio.sleep(delay)
+        start = time.perf_counter()
+        response = await function(**kwargs)
+        if kwargs.get("stream"):
+            return _SettledStream(response, model, reserved)
+        record_latency(model, operation, time.perf_counter() - start)
+        settle(model, reserved, getattr(response, "usage", None))
+        return response
+
+    async def _hedged(self, model, operation, function, kwargs, reserved):
+        delay = hedge_delay(model, operation)
+        if delay is None:
+            return await self._attempt(model, operation, function, kwargs, reserved)
+        tasks = [asyncio.ensure_future(self._attempt(model, operation, function, kwargs, reserved))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not take_hedge(model):
+                return await tasks[0]
+            tasks.append(asyncio.ensure_future(self._attempt(model, operation, function, kwargs, reserved)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is tasks[1]:
+                            hedges_total.inc(model, "won")
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            # The losing request, or both if the caller was cancelled, is abandoned mid-flight
+            for task in tasks:
+                task.cancel()
+
+def create_client():
+    """
+    The synchronous OpenAI client every module shares, wrapped in ModelClient.
+    """
+    from openai import OpenAI
+    return ModelClient(OpenAI(max_retries=0, timeout=REQUEST_TIMEOUT))
+
+def create_async_client():
+    from openai import AsyncOpenAI
+    return AsyncModelClient(AsyncOpenAI(max_retries=0, timeout=REQUEST_TIMEOUT))
@@ -1,42 +1,33 @@
-import os
-from dotenv import load_dotenv
-from openai import OpenAI
+import logging
 import gradio as gr
-
-load_dotenv(override=True)
-openai_api_key = os.getenv('OPENAI_API_KEY')
-google_api_key = os.getenv('GOOGLE_API_KEY')
-
-
-if openai_api_key:
-    print(f"OpenAI API Key exists and begins {openai_api_key[:8]}")
-else:
-    print("OpenAI API Key not set")
-    
-if google_api_key:
-    print(f"Google API Key exists and begins {google_api_key[:8]}")
-else:
-    print("Google API Key not set")
+from bootstrap import initialize
+from chatStreaming import StreamedTurn, coalesce
+from asyncChat import stream_completion, session_id
+from historyManager import HistoryManager
 
 # Initialize
-openai = OpenAI()
+initialize("OPENAI_API_KEY", "GOOGLE_API_KEY")
+log = logging.getLogger(__name__)
 MODEL = 'gpt-4o-mini'
 
+history_manager = HistoryManager(MODEL)
+
 system_message = "You are a helpful assistant"
 
-def chat(message, history):
-    messages = [{"role": "system", "content": system_message}] + history + [{"role": "user", "content": message}]
+async def chat(message, history, request: gr.Request = None):
+    session = session_id(request)
+    messages = [{"role": "system", "content": system_message}] + await history_manager.compact(history, session) + [{"role": "user", "content": message}]
 
-    print("History is:")
-    print(history)
-    print("And messages is:")
-    print(messages)
+    log.debug("History is: %s", history)
+    log.debug("And messages is: %s", messages)
 
-    stream = openai.chat.completions.create(model=MODEL, messages=messages, stream=True)
+    stream = stream_completion(session, model=MODEL, messages=messages)
 
-    response = ""
-    for chunk in stream:
-        response += chunk.choices[0].delta.content or ''
+    async for response in coalesce(StreamedTurn().aconsume(stream)):
         yield response
 
-gr.ChatInterface(fn=chat, type="messages").launch()
\ No newline at end of file
+def launch():
+    gr.ChatInterface(fn=chat, type="messages").launch()
+
+if __name__ == "__main__":
+    launch()
@@ -1,59 +1,70 @@
 # imports
 
-import os
-import json
-from dotenv import load_dotenv
-from openai import OpenAI
+import logging
 import gradio as gr
+from bootstrap import initialize
+from chatStreaming import StreamedTurn, coalesce
+from asyncChat import stream_completion, session_id
+from historyManager import HistoryManager
+from toolDispatcher import ToolDispatcher
+from fareStore import get_fare_store
+from answerCache import AnswerCache
+from crawlCache import content_hash
 
 # Initialization
+initialize("OPENAI_API_KEY")
+log = logging.getLogger(__name__)
 
-load_dotenv(override=True)
-
-openai_api_key = os.getenv('OPENAI_API_KEY')
-if openai_api_key:
-    print(f"OpenAI API Key exists and begins {openai_api_key[:8]}")
-else:
-    print("OpenAI API Key not set")
-    
 MODEL = "gpt-4o-mini"
-openai = OpenAI()
+
+history_manager = HistoryManager(MODEL)
 
 system_message = "You are a helpful assistant for an Airline called FlightAI. "
 system_message += "Give short, courteous answers, no more than 1 sentence. "
 system_message += "Always be accurate. If you don't know the answer, say so."
 
-def chat(message, history):
-    messages = [{"role": "system", "content": system_message}] + history + [{"role": "user", "content": message}]
-    response = openai.chat.completions.create(model=MODEL, messages=messages, tools=tools)
-
-    if response.choices[0].finish_reason=="tool_calls":
-        message = response.choices[0].message
-        response, city = handle_tool_call(message)
-        messages.append(message)
-        messages.append(response)
-        response = openai.chat.completions.create(model=MODEL, messages=messages)
-    
-    return response.choices[0].message.content
-
-def handle_tool_call(message):
-    tool_call = message.tool_calls[0]
-    arguments = json.loads(tool_call.function.arguments)
-    city = arguments.get('destination_city')
-    price = get_ticket_price(city)
-    response = {
-        "role": "tool",
-        "content": json.dumps({"destination_city": city,"price": price}),
-        "tool_call_id": tool_call.id
-    }
-    return response, city
+# Repeat questions are answered without a model call; a change to the prompt, model or fares empties it
+answer_cache = AnswerCache("airline_answers", version=lambda: content_hash(MODEL, get_fare_store().version),
+                           key_terms=lambda: get_fare_store().city_names())
+
+async def chat(message, history, request: gr.Request = None):
+    cached = answer_cache.lookup(system_message, message, history)
+    if cached is not None:
+        log.debug("Answer cache hit, hit rate %.0f%%", answer_cache.get_stats()["hit_rate"] * 100)
+        yield cached
+        return
+
+    session = session_id(request)
+    messages = [{"role": "system", "content": system_message}] + await history_manager.compact(history, session) + [{"role": "user", "content": message}]
+    stream = stream_completion(session, model=MODEL, messages=messages, tools=tools)
+    turn = StreamedTurn()
+    response = ""
+    async for response in coalesce(turn.aconsume(stream)):
+        yield response
 
-ticket_prices = {"london": "$799", "paris": "$899", "tokyo": "$1400", "berlin": "$499"}
+    if turn.finish_reason=="tool_calls":
+        tool_message = turn.message()
+        messages.append(tool_message)
+        messages += await dispatcher.adispatch(tool_message["tool_calls"])
+        stream = stream_completion(session, model=MODEL, messages=messages)
+        async for response in coalesce(StreamedTurn().aconsume(stream), prefix=response):
+            yield response
+
+    answer_cache.store(system_message, message, history, response)
+
+def ticket_price_tool(destination_city):
+    result = {"destination_city": destination_city, "price": get_ticket_price(destination_city)}
+    if result["price"] == "Unknown":
+        # A near miss is never priced: the model asks the customer whether they meant the suggestion
+        suggestion = get_fare_store().suggest_city(destination_city)
+        if suggestion:
+            result["did_you_mean"] = suggestion.title()
+    return result
 
 def get_ticket_price(destination_city):
-    print(f"Tool get_ticket_price called for {destination_city}")
-    city = destination_city.lower()
-    return ticket_prices.get(city, "Unknown")
+    log.debug("Tool get_ticket_price called for %s", destination_city)
+    fare = get_fare_store().lookup(destination_city)
+    return fare["price"] if fare else "Unknown"
 
 price_function = {
     "name": "get_ticket_price",
@@ -74,4 +85,11 @@ price_function = {
 # And this is included in a list of tools:
 tools = [{"type": "function", "function": price_function}]
 
-gr.ChatInterface(fn=chat, type="messages").launch()
\ No newline at end of file
+# Tool name -> implementation; every tool call of a turn runs concurrently
+dispatcher = ToolDispatcher({"get_ticket_price": ticket_price_tool})
+
+def launch():
+    gr.ChatInterface(fn=chat, type="messages").launch()
+
+if __name__ == "__main__":
+    launch()
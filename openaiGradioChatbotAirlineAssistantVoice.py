@@ -1,99 +1,161 @@
 # imports
 import os
 import json
-from dotenv import load_dotenv
-from openai import OpenAI
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
 import gradio as gr
+from bootstrap import initialize, openai
+from chatStreaming import StreamedTurn
+from asyncChat import stream_completion, session_id
+from historyManager import HistoryManager
+from toolDispatcher import ToolDispatcher
+from fareStore import get_fare_store
+from fileCache import FileCache
+from speechPipeline import SpeechPipeline
+from telemetry import span
 
 # Some imports for handling images
 import base64
-from io import BytesIO
-from PIL import Image
 
 
 # Initialization
-load_dotenv(override=True)
-
-openai_api_key = os.getenv('OPENAI_API_KEY')
-if openai_api_key:
-    print(f"OpenAI API Key exists and begins {openai_api_key[:8]}")
-else:
-    print("OpenAI API Key not set")
-    
+initialize("OPENAI_API_KEY")
+log = logging.getLogger(__name__)
+
 MODEL = "gpt-4o-mini"
-openai = OpenAI()
+
+history_manager = HistoryManager(MODEL)
 
 system_message = "You are a helpful assistant for an Airline called FlightAI. "
 system_message += "Give short, courteous answers, no more than 1 sentence. "
 system_message += "Always be accurate. If you don't know the answer, say so."
 
+IMAGE_MODEL = "dall-e-3"
+IMAGE_SIZE = "1024x1024"
+IMAGE_PROMPT = "An image representing a vacation in {city}, showing tourist spots and everything unique about {city}, in a vibrant pop-art style"
+
+# Generated destination images, keyed by model, city, prompt and size
+image_cache = FileCache("images", ".png")
+
 def artist(city):
-    image_response = openai.images.generate(
-            model="dall-e-3",
-            prompt=f"An image representing a vacation in {city}, showing tourist spots and everything unique about {city}, in a vibrant pop-art style",
-            size="1024x1024",
-            n=1,
-            response_format="b64_json",
-        )
+    key = image_cache.key(IMAGE_MODEL, " ".join(city.lower().split()), IMAGE_PROMPT, IMAGE_SIZE)
+    cached = image_cache.get(key)
+    if cached:
+        return cached
+    with span("image", IMAGE_MODEL, city=city):
+        image_response = openai.images.generate(
+                model=IMAGE_MODEL,
+                prompt=IMAGE_PROMPT.format(city=city),
+                size=IMAGE_SIZE,
+                n=1,
+                response_format="b64_json",
+            )
     image_base64 = image_response.data[0].b64_json
-    image_data = base64.b64decode(image_base64)
-    return Image.open(BytesIO(image_data))
+    # The PNG goes to Gradio as a file path, without decoding it into a PIL image
+    return image_cache.put(key, base64.b64decode(image_base64))
 
 #image = artist("New York City")
 #display(image)
 
-from pydub import AudioSegment
-from pydub.playback import play
+TTS_MODEL = "tts-1"
+TTS_VOICE = "onyx"    # Also, try replacing onyx with alloy
+
+# Synthesized sentences, keyed by model, voice and text, so stock phrases are only synthesized once
+speech_cache = FileCache("speech", ".mp3")
 
 def talker(message):
-    response = openai.audio.speech.create(
-      model="tts-1",
-      voice="onyx",    # Also, try replacing onyx with alloy
-      input=message
-    )
-    
-    audio_stream = BytesIO(response.content)
-    audio = AudioSegment.from_file(audio_stream, format="mp3")
-    play(audio)
-
-def chat(history):
-    messages = [{"role": "system", "content": system_message}] + history
-    response = openai.chat.completions.create(model=MODEL, messages=messages, tools=tools)
+    key = speech_cache.key(TTS_MODEL, TTS_VOICE, message)
+    cached = speech_cache.get(key)
+    if cached:
+        return cached
+    with span("tts", TTS_MODEL, chars=len(message)):
+        response = openai.audio.speech.create(
+          model=TTS_MODEL,
+          voice=TTS_VOICE,
+          input=message
+        )
+    # Sent to the browser's audio player rather than played on the server
+    return speech_cache.put(key, response.content)
+
+# Image generation and speech synthesis run here, alongside the reply
+media_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="media")
+
+async def chat(history, request: gr.Request = None):
+    """
+    Streams the reply into the chat and speaks it sentence by sentence while it is being written;
+    the destination image follows when ready. Yields (history, image, audio clip), where
+    gr.update() leaves an output unchanged.
+    """
+    session = session_id(request)
+    messages = [{"role": "system", "content": system_message}] + await history_manager.compact(history, session)
+    history = history + [{"role": "assistant", "content": ""}]
+    speech = SpeechPipeline(media_executor, talker)
+
+    async def stream_reply(stream, turn):
+        async for text in turn.aconsume(stream):
+            history[-1]["content"] += text
+            speech.feed(text)
+            yield history, gr.update(), gr.update()
+            for clip in speech.ready():
+                yield history, gr.update(), clip
+
+    turn = StreamedTurn()
+    async for update in stream_reply(stream_completion(session, model=MODEL, messages=messages, tools=tools), turn):
+        yield update
+
     image = None
-    
-    if response.choices[0].finish_reason=="tool_calls":
-        message = response.choices[0].message
-        response, city = handle_tool_call(message)
+    if turn.finish_reason=="tool_calls":
+        message = turn.message()
+        city = tool_destination(message["tool_calls"][0])
+        if city:
+            # The fare table's spelling, so "Tokio" and "Tokyo" share a cached image
+            city = get_fare_store().match_city(city) or city
+            # Start the image now so it is generated while the tool runs and the reply is written
+            image = media_executor.submit(artist, city)
         messages.append(message)
-        messages.append(response)
-        image = artist(city)
-        response = openai.chat.completions.create(model=MODEL, messages=messages)
-        
-    reply = response.choices[0].message.content
-    history += [{"role":"assistant", "content":reply}]
-
-    talker(reply)
-    
-    return history, image
-
-def handle_tool_call(message):
-    tool_call = message.tool_calls[0]
-    arguments = json.loads(tool_call.function.arguments)
-    city = arguments.get('destination_city')
-    price = get_ticket_price(city)
-    response = {
-        "role": "tool",
-        "content": json.dumps({"destination_city": city,"price": price}),
-        "tool_call_id": tool_call.id
-    }
-    return response, city
-
-ticket_prices = {"london": "$799", "paris": "$899", "tokyo": "$1400", "berlin": "$499"}
+        messages += await dispatcher.adispatch(message["tool_calls"])
+        async for update in stream_reply(stream_completion(session, model=MODEL, messages=messages), StreamedTurn()):
+            yield update
+
+    speech.finish()
+    while speech.pending() or image:
+        waiting = [asyncio.wrap_future(future) for future in (speech.next_clip(), image) if future]
+        await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+        if image and image.done():
+            try:
+                yield history, image.result(), gr.update()
+            except Exception as error:
+                log.warning("Could not generate image: %r", error)
+            image = None
+        for clip in speech.ready():
+            yield history, gr.update(), clip
+
+def tool_destination(tool_call):
+    """
+    Returns the destination_city argument of a tool call, or None if the model sent none or arguments
+    that are not a JSON object; the dispatcher reports those to the model as the tool's error.
+    """
+    try:
+        arguments = json.loads(tool_call["function"]["arguments"] or "{}")
+    except json.JSONDecodeError as error:
+        log.warning("Invalid tool call arguments: %s", error)
+        return None
+    return arguments.get("destination_city") if isinstance(arguments, dict) else None
+
+def ticket_price_tool(destination_city):
+    result = {"destination_city": destination_city, "price": get_ticket_price(destination_city)}
+    if result["price"] == "Unknown":
+        # A near miss is never priced: the model asks the customer whether they meant the suggestion
+        suggestion = get_fare_store().suggest_city(destination_city)
+        if suggestion:
+            result["did_you_mean"] = suggestion.title()
+    return result
 
 def get_ticket_price(destination_city):
-    print(f"Tool get_ticket_price called for {destination_city}")
-    city = destination_city.lower()
-    return ticket_prices.get(city, "Unknown")
+    log.debug("Tool get_ticket_price called for %s", destination_city)
+    fare = get_fare_store().lookup(destination_city)
+    return fare["price"] if fare else "Unknown"
 
 price_function = {
     "name": "get_ticket_price",
@@ -113,23 +175,46 @@ price_function = {
 
 tools = [{"type": "function", "function": price_function}]
 
+# Tool name -> implementation; every tool call of a turn runs concurrently
+dispatcher = ToolDispatcher({"get_ticket_price": ticket_price_tool})
+
+PREWARM_LIMIT = int(os.getenv("PREWARM_LIMIT", "50"))  # destinations whose image PREWARM_IMAGES makes sure of
+PREWARM_WORKERS = 2                                    # images generated at the same time by the prewarm
+
+# Its own workers, so the first users' images and speech don't queue behind the prewarm
+prewarm_executor = ThreadPoolExecutor(max_workers=PREWARM_WORKERS, thread_name_prefix="prewarm")
+
+def prewarm_images(limit=PREWARM_LIMIT):
+    # Generate the image of the first limit destinations in the fare table that aren't cached yet
+    for city in get_fare_store().destinations()[:limit]:
+        prewarm_executor.submit(artist, city)
 
-with gr.Blocks() as ui:
-    with gr.Row():
-        chatbot = gr.Chatbot(height=500, type="messages")
-        image_output = gr.Image(height=500)
-    with gr.Row():
-        entry = gr.Textbox(label="Chat with our AI Assistant:")
-    with gr.Row():
-        clear = gr.Button("Clear")
 
-    def do_entry(message, history):
-        history += [{"role":"user", "content":message}]
-        return "", history
+def launch():
+    if os.getenv("PREWARM_IMAGES"):
+        prewarm_images()
+
+    with gr.Blocks() as ui:
+        with gr.Row():
+            chatbot = gr.Chatbot(height=500, type="messages")
+            image_output = gr.Image(height=500)
+        with gr.Row():
+            audio_output = gr.Audio(streaming=True, autoplay=True)
+        with gr.Row():
+            entry = gr.Textbox(label="Chat with our AI Assistant:")
+        with gr.Row():
+            clear = gr.Button("Clear")
+
+        def do_entry(message, history):
+            history += [{"role":"user", "content":message}]
+            return "", history
+
+        entry.submit(do_entry, inputs=[entry, chatbot], outputs=[entry, chatbot]).then(
+            chat, inputs=chatbot, outputs=[chatbot, image_output, audio_output]
+        )
+        clear.click(lambda: None, inputs=None, outputs=chatbot, queue=False)
 
-    entry.submit(do_entry, inputs=[entry, chatbot], outputs=[entry, chatbot]).then(
-        chat, inputs=chatbot, outputs=[chatbot, image_output]
-    )
-    clear.click(lambda: None, inputs=None, outputs=chatbot, queue=False)
+    ui.launch(inbrowser=True)
 
-ui.launch(inbrowser=True)
\ No newline at end of file
+if __name__ == "__main__":
+    launch()
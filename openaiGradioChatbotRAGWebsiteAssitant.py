@@ -1,25 +1,23 @@
 # imports
-import os
-import json
-from dotenv import load_dotenv
-from openai import OpenAI
+import asyncio
+import logging
 import gradio as gr
-import requests
-from typing import List
-from bs4 import BeautifulSoup
-from IPython.display import Markdown, display, update_display
+from bootstrap import initialize
+from chatStreaming import StreamedTurn, coalesce
+from asyncChat import stream_completion, session_id
+from historyManager import HistoryManager
+from toolDispatcher import ToolDispatcher
+from contextPacker import pack_pages
+from siteCrawler import SiteCrawler, site_url
+from siteIndex import HashingEmbedder, index_site, retrieve_context
 
 # Initialization
-load_dotenv(override=True)
-
-openai_api_key = os.getenv('OPENAI_API_KEY')
-if openai_api_key:
-    print(f"OpenAI API Key exists and begins {openai_api_key[:8]}")
-else:
-    print("OpenAI API Key not set")
-    
+initialize("OPENAI_API_KEY")
+log = logging.getLogger(__name__)
+
 MODEL = "gpt-4o-mini"
-openai = OpenAI()
+
+history_manager = HistoryManager(MODEL)
 
 system_message = "You are a helpful assistant for internet users called WebsiteDetailsAI. "
 system_message += "You analyzes the contents of several relevant pages from a company website \
@@ -27,36 +25,47 @@ and creates detailed answers about the company for prospective customers, invest
 system_message += "Give detailed summary answers for any website and answer questions based on the information gathered. "
 system_message += "You are able to call a function to get the details of a website. "
 system_message += "Always be accurate. Respond in markdown. If you don't know the answer, say so."
-
-def chat(message, history):
-    messages = [{"role": "system", "content": system_message}] + history + [{"role": "user", "content": message}]
-    response = openai.chat.completions.create(model=MODEL, messages=messages, tools=tools)
-
-    if response.choices[0].finish_reason=="tool_calls":
-        message = response.choices[0].message
-        response, website_details = handle_tool_call(message)
-        messages.append(message)
-        messages.append(response)
-        response = openai.chat.completions.create(model=MODEL, messages=messages)
-    
-    return response.choices[0].message.content
-
-def handle_tool_call(message):
-    tool_call = message.tool_calls[0]
-    arguments = json.loads(tool_call.function.arguments)
-    url = arguments.get('destination_website_url')
-    website_details = get_website_details(url)
-    response = {
-        "role": "tool",
-        "content": json.dumps({"destination_website_url": url,"website_details": website_details}),
-        "tool_call_id": tool_call.id
-    }
-    return response, url
+system_message += " If relevant excerpts from a website you already gathered are provided, answer from them \
+instead of calling the function for the same website again."
+
+# Embeds the chunks of scraped sites for follow-up questions; swap in OpenAIEmbedder(openai) for semantic search
+embedder = HashingEmbedder()
+
+async def chat(message, history, request: gr.Request = None):
+    # The landing page of a url in the message is fetched now, while the model decides
+    prefetched = crawler.prefetcher.start(message)
+    try:
+        session = session_id(request)
+        messages = [{"role": "system", "content": system_message}] + await history_manager.compact(history, session) + [{"role": "user", "content": message}]
+        # Off the event loop: the index lookup reads SQLite and maps the vectors from disk, and embeds the message
+        context = await asyncio.to_thread(retrieve_context, message, history, embedder=embedder)
+        if context:
+            messages.insert(-1, {"role": "system", "content": context})
+        stream = stream_completion(session, model=MODEL, messages=messages, tools=tools)
+        turn = StreamedTurn()
+        response = ""
+        async for response in coalesce(turn.aconsume(stream)):
+            yield response
+
+        if turn.finish_reason=="tool_calls":
+            message = turn.message()
+            messages.append(message)
+            messages += await dispatcher.adispatch(message["tool_calls"])
+            stream = stream_completion(session, model=MODEL, messages=messages)
+            async for response in coalesce(StreamedTurn().aconsume(stream), prefix=response):
+                yield response
+    finally:
+        crawler.prefetcher.release(prefetched)
+
+def website_details_tool(destination_website_url):
+    return {"destination_website_url": destination_website_url, "website_details": get_website_details(destination_website_url)}
 
 def get_website_details(destination_website_url):
-    print(f"Tool get_website_details called for {destination_website_url}")
-    destination_website_url = destination_website_url.lower()
-    return get_all_details(destination_website_url)
+    log.debug("Tool get_website_details called for %s", destination_website_url)
+    destination_website_url = site_url(destination_website_url)
+    pages = crawler.get_all_pages(destination_website_url)
+    index_site(destination_website_url, pages, embedder)
+    return pack_pages(pages, DETAILS_TOKEN_BUDGET, MODEL)
 
 website_details_function = {
     "name": "get_website_details",
@@ -78,35 +87,10 @@ website_details_function = {
 # And this is included in a list of tools:
 tools = [{"type": "function", "function": website_details_function}]
 
+# Tool name -> implementation; every tool call of a turn runs concurrently
+dispatcher = ToolDispatcher({"get_website_details": website_details_tool})
 
-# Some websites need you to use proper headers when fetching them:
-headers = {
- "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
-}
 
-class Website:
-    """
-    A utility class to represent a Website that we have scraped, now with links
-    """
-
-    def __init__(self, url):
-        self.url = url
-        response = requests.get(url, headers=headers)
-        self.body = response.content
-        soup = BeautifulSoup(self.body, 'html.parser')
-        self.title = soup.title.string if soup.title else "No title found"
-        if soup.body:
-            for irrelevant in soup.body(["script", "style", "img", "input"]):
-                irrelevant.decompose()
-            self.text = soup.body.get_text(separator="\n", strip=True)
-        else:
-            self.text = ""
-        links = [link.get('href') for link in soup.find_all('a')]
-        self.links = [link for link in links if link]
-
-    def get_contents(self):
-        return f"Webpage Title:\n{self.title}\nWebpage Contents:\n{self.text}\n\n"
-    
 link_system_prompt = "You are provided with a list of links found on a webpage. \
 You are able to decide which of the links would be most relevant to include gather information and details about the company, \
 such as links to an About page, or a Company page, or Careers/Jobs pages.\n"
@@ -129,28 +113,16 @@ Do not include Terms of Service, Privacy, email links.\n"
     user_prompt += "\n".join(website.links)
     return user_prompt
 
-def get_links(url):
-    website = Website(url)
-    response = openai.chat.completions.create(
-        model=MODEL,
-        messages=[
-            {"role": "system", "content": link_system_prompt},
-            {"role": "user", "content": get_links_user_prompt(website)}
-      ],
-        response_format={"type": "json_object"}
-    )
-    result = response.choices[0].message.content
-    return json.loads(result)
-
-def get_all_details(url):
-    print("Getting all details for URL: ", url)
-    result = "Landing page:\n"
-    result += Website(url).get_contents()
-    links = get_links(url)
-    print("Found links:", links)
-    for link in links["links"]:
-        result += f"\n\n{link['type']}\n"
-        result += Website(link["url"]).get_contents()
-    return result
-
-gr.ChatInterface(fn=chat, type="messages").launch(inbrowser=True, share=True, debug=True)
\ No newline at end of file
+DETAILS_TOKEN_BUDGET = 6000  # tokens of website details sent to the model
+
+# The landing page, link selection and sub-pages of a site, shared by concurrent questions about it
+crawler = SiteCrawler("website", MODEL, link_system_prompt, get_links_user_prompt, "website_pages")
+
+def get_all_details(url, token_budget=DETAILS_TOKEN_BUDGET):
+    return pack_pages(crawler.get_all_pages(url), token_budget, MODEL)
+
+def launch():
+    gr.ChatInterface(fn=chat, type="messages").launch(inbrowser=True, share=True, debug=True)
+
+if __name__ == "__main__":
+    launch()
@@ -1,29 +1,26 @@
 # imports
-import os
-import json
-from dotenv import load_dotenv
-from openai import OpenAI
+import asyncio
+import logging
 import gradio as gr
-import requests
-from typing import List
-from bs4 import BeautifulSoup
-from IPython.display import Markdown, display, update_display
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
+from bootstrap import initialize, lazy_import
+from chatStreaming import StreamedTurn, coalesce
+from asyncChat import stream_completion, session_id
+from historyManager import HistoryManager
+from toolDispatcher import ToolDispatcher
+from contextPacker import pack_pages
+from siteCrawler import SiteCrawler, site_url
+from siteIndex import HashingEmbedder, index_site, retrieve_context
 
 # Initialization
-load_dotenv(override=True)
-
-openai_api_key = os.getenv('OPENAI_API_KEY')
-if openai_api_key:
-    print(f"OpenAI API Key exists and begins {openai_api_key[:8]}")
-else:
-    print("OpenAI API Key not set")
-    
+initialize("OPENAI_API_KEY")
+log = logging.getLogger(__name__)
+
 MODEL = "gpt-4o-mini"
-openai = OpenAI()
+
+history_manager = HistoryManager(MODEL)
+
+# The scraper (requests, urllib3) is only loaded the first time a tool fetches a website
+websiteScraper = lazy_import("websiteScraper")
 
 system_message = "You are a helpful assistant for internet users called WebsiteDetailsAI. "
 system_message += "You analyzes the contents of several relevant pages from a company website \
@@ -33,53 +30,49 @@ answer questions based on the information gathered. "
 system_message += "You are able to call a function to get the details of a website. "
 system_message += "You are able to call a function to get the social media links of a website. "
 system_message += "Always be accurate. Respond in markdown. If you don't know the answer, say so."
+system_message += " If relevant excerpts from a website you already gathered are provided, answer from them \
+instead of calling the function for the same website again."
+
+# Embeds the chunks of scraped sites for follow-up questions; swap in OpenAIEmbedder(openai) for semantic search
+embedder = HashingEmbedder()
 
-def chat(message, history):
-    updated_system_message = system_message
-    if 'http' not in message:
-        updated_system_message += " If the user does not provide a website URL, please ask the user to please provide a website url."
-    elif message.count('http') > 1:
-        updated_system_message += " If the user provides more than one website URL, perhaps clarify which one to use and please ask them to only provide one website url for each question."
-
-    messages = [{"role": "system", "content": system_message}] + history + [{"role": "user", "content": message}]
-    response = openai.chat.completions.create(model=MODEL, messages=messages, tools=tools)
-
-    if response.choices[0].finish_reason == "tool_calls":
-        message = response.choices[0].message
-        tool_call = message.tool_calls[0]
-        tool_name = tool_call.function.name
-        arguments = json.loads(tool_call.function.arguments)
-        print(arguments)
-
-        if tool_name == "get_website_details":
-            print("Tool get_website_details called with: ", arguments.get('destination_website_url'))
-            url = arguments.get('destination_website_url')
-            if not url:
-                return {"error": "No URL provided for get_website_details"}
-            tool_response = get_website_details(url)
-        elif tool_name == "get_social_media_links":
-            print("Tool get_social_media_links called with: ", arguments.get('url'))
-            url = arguments.get('url')
-            if not url:
-                return {"error": "No URL provided for get_social_media_links"}
-            tool_response = get_social_media_links(url)
-        else:
-            tool_response = {"error": "Unknown tool called"}
-
-        response_message = {
-            "role": "tool",
-            "content": json.dumps(tool_response),
-            "tool_call_id": tool_call.id
-        }
-        messages.append(message)
-        messages.append(response_message)
-        response = openai.chat.completions.create(model=MODEL, messages=messages)
-
-    return response.choices[0].message.content
+async def chat(message, history, request: gr.Request = None):
+    # The landing page of a url in the message is fetched now, while the model decides
+    prefetched = crawler.prefetcher.start(message)
+    try:
+        session = session_id(request)
+        updated_system_message = system_message
+        if 'http' not in message:
+            updated_system_message += " If the user does not provide a website URL, please ask the user to please provide a website url."
+        elif message.count('http') > 1:
+            updated_system_message += " If the user provides more than one website URL, perhaps clarify which one to use and please ask them to only provide one website url for each question."
+
+        messages = [{"role": "system", "content": system_message}] + await history_manager.compact(history, session) + [{"role": "user", "content": message}]
+        # Off the event loop: the index lookup reads SQLite and maps the vectors from disk, and embeds the message
+        context = await asyncio.to_thread(retrieve_context, message, history, embedder=embedder)
+        if context:
+            messages.insert(-1, {"role": "system", "content": context})
+        stream = stream_completion(session, model=MODEL, messages=messages, tools=tools)
+        turn = StreamedTurn()
+        response = ""
+        async for response in coalesce(turn.aconsume(stream)):
+            yield response
+
+        if turn.finish_reason == "tool_calls":
+            message = turn.message()
+            messages.append(message)
+            messages += await dispatcher.adispatch(message["tool_calls"])
+            stream = stream_completion(session, model=MODEL, messages=messages)
+            async for response in coalesce(StreamedTurn().aconsume(stream), prefix=response):
+                yield response
+    finally:
+        crawler.prefetcher.release(prefetched)
 
 def get_website_details(destination_website_url):
-    destination_website_url = destination_website_url.lower()
-    return get_all_details(destination_website_url)
+    destination_website_url = site_url(destination_website_url)
+    pages = crawler.get_all_pages(destination_website_url)
+    index_site(destination_website_url, pages, embedder)
+    return pack_pages(pages, DETAILS_TOKEN_BUDGET, MODEL)
 
 website_details_function = {
     "name": "get_website_details",
@@ -120,34 +113,6 @@ tools = [
     {"type": "function", "function": social_media_links_function}
 ]
 
-# Some websites need you to use proper headers when fetching them:
-headers = {
- "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
-}
-
-class Website:
-    """
-    A utility class to represent a Website that we have scraped, now with links
-    """
-
-    def __init__(self, url):
-        self.url = url
-        response = requests.get(url, headers=headers)
-        self.body = response.content
-        soup = BeautifulSoup(self.body, 'html.parser')
-        self.title = soup.title.string if soup.title else "No title found"
-        if soup.body:
-            for irrelevant in soup.body(["script", "style", "img", "input"]):
-                irrelevant.decompose()
-            self.text = soup.body.get_text(separator="\n", strip=True)
-        else:
-            self.text = ""
-        links = [link.get('href') for link in soup.find_all('a')]
-        self.links = [link for link in links if link]
-
-    def get_contents(self):
-        return f"Webpage Title:\n{self.title}\nWebpage Contents:\n{self.text}\n\n"
-    
 link_system_prompt = "You are provided with a list of links found on a webpage. \
 You are able to decide which of the links would be most relevant to include gather information and details about the company, \
 such as links to an About page, or a Company page, or Careers/Jobs pages.\n"
@@ -170,29 +135,13 @@ Do not include Terms of Service, Privacy, email links.\n"
     user_prompt += "\n".join(website.links)
     return user_prompt
 
-def get_links(url):
-    website = Website(url)
-    response = openai.chat.completions.create(
-        model=MODEL,
-        messages=[
-            {"role": "system", "content": link_system_prompt},
-            {"role": "user", "content": get_links_user_prompt(website)}
-      ],
-        response_format={"type": "json_object"}
-    )
-    result = response.choices[0].message.content
-    return json.loads(result)
-
-def get_all_details(url):
-    print("Getting all details for URL: ", url)
-    result = "Landing page:\n"
-    result += Website(url).get_contents()
-    links = get_links(url)
-    print("Found links:", links)
-    for link in links["links"]:
-        result += f"\n\n{link['type']}\n"
-        result += Website(link["url"]).get_contents()
-    return result
+DETAILS_TOKEN_BUDGET = 6000  # tokens of website details sent to the model
+
+# The landing page, link selection and sub-pages of a site, shared by concurrent questions about it
+crawler = SiteCrawler("social", MODEL, link_system_prompt, get_links_user_prompt, "website_pages")
+
+def get_all_details(url, token_budget=DETAILS_TOKEN_BUDGET):
+    return pack_pages(crawler.get_all_pages(url), token_budget, MODEL)
 
 def take_screenshot(url, output_path):
     """
@@ -202,6 +151,12 @@ def take_screenshot(url, output_path):
         url (str): The URL of the webpage to capture.
         output_path (str): The file path to save the screenshot.
     """
+    # Imported here so the bot starts without loading selenium until a screenshot is needed
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+    from webdriver_manager.chrome import ChromeDriverManager
+
     options = Options()
     options.add_argument('--headless')
     options.add_argument('--disable-gpu')
@@ -212,7 +167,7 @@ def take_screenshot(url, output_path):
     try:
         driver.get(url)
         driver.save_screenshot(output_path)
-        print(f"Screenshot saved to {output_path}")
+        log.info("Screenshot saved to %s", output_path)
     finally:
         driver.quit()
 
@@ -226,7 +181,7 @@ def get_social_media_links(url):
     Returns:
         list: A JSON list containing social media site names and their URLs.
     """
-    website = Website(url)
+    website = websiteScraper.fetch_website(url, timeout=websiteScraper.PAGE_TIMEOUT)
     social_media_sites = ["facebook.com", "twitter.com", "linkedin.com", "instagram.com", "youtube.com"]
     social_links = []
 
@@ -241,4 +196,14 @@ def get_social_media_links(url):
 # social_links = get_social_media_links("https://example.com")
 # print(json.dumps(social_links, indent=2))
 
-gr.ChatInterface(fn=chat, type="messages").launch(inbrowser=True, share=True, debug=True)
\ No newline at end of file
+# Tool name -> implementation; every tool call of a turn runs concurrently
+dispatcher = ToolDispatcher({
+    "get_website_details": get_website_details,
+    "get_social_media_links": get_social_media_links,
+})
+
+def launch():
+    gr.ChatInterface(fn=chat, type="messages").launch(inbrowser=True, share=True, debug=True)
+
+if __name__ == "__main__":
+    launch()
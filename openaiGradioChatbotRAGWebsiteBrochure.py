@@ -1,58 +1,57 @@
 # imports
-import os
-import json
-from dotenv import load_dotenv
-from openai import OpenAI
+import logging
 import gradio as gr
-import requests
-from typing import List
-from bs4 import BeautifulSoup
-from IPython.display import Markdown, display, update_display
+from bootstrap import initialize, openai
+from chatStreaming import StreamedTurn, coalesce
+from asyncChat import stream_completion, session_id
+from historyManager import HistoryManager
+from toolDispatcher import ToolDispatcher
+from telemetry import span, record_usage
+from singleFlight import SingleFlight
+from siteCrawler import SiteCrawler, site_url
+from crawlCache import CrawlCache, normalize_url
+from contextPacker import pack_pages, count_tokens
 
 # Initialization
-load_dotenv(override=True)
-
-openai_api_key = os.getenv('OPENAI_API_KEY')
-if openai_api_key:
-    print(f"OpenAI API Key exists and begins {openai_api_key[:8]}")
-else:
-    print("OpenAI API Key not set")
-    
+initialize("OPENAI_API_KEY")
+log = logging.getLogger(__name__)
+
 MODEL = "gpt-4o-mini"
-openai = OpenAI()
+
+history_manager = HistoryManager(MODEL)
 
 system_message = "You are a helpful assistant for internet users called WebsiteBrochureAI. "
 system_message += "Give detailed brochure answers for any website and answer questions based on the information gathered. "
 system_message += "Always be accurate. If you don't know the answer, say so."
 
-def chat(message, history):
-    messages = [{"role": "system", "content": system_message}] + history + [{"role": "user", "content": message}]
-    response = openai.chat.completions.create(model=MODEL, messages=messages, tools=tools)
-
-    if response.choices[0].finish_reason=="tool_calls":
-        message = response.choices[0].message
-        response, brochure = handle_tool_call(message)
-        messages.append(message)
-        messages.append(response)
-        response = openai.chat.completions.create(model=MODEL, messages=messages)
-    
-    return response.choices[0].message.content
-
-def handle_tool_call(message):
-    tool_call = message.tool_calls[0]
-    arguments = json.loads(tool_call.function.arguments)
-    url = arguments.get('destination_website_url')
-    brochure = get_website_brochure(url)
-    response = {
-        "role": "tool",
-        "content": json.dumps({"destination_website_url": url,"brochure": brochure}),
-        "tool_call_id": tool_call.id
-    }
-    return response, url
+async def chat(message, history, request: gr.Request = None):
+    # The landing page of a url in the message is fetched now, while the model decides
+    prefetched = crawler.prefetcher.start(message)
+    try:
+        session = session_id(request)
+        messages = [{"role": "system", "content": system_message}] + await history_manager.compact(history, session) + [{"role": "user", "content": message}]
+        stream = stream_completion(session, model=MODEL, messages=messages, tools=tools)
+        turn = StreamedTurn()
+        response = ""
+        async for response in coalesce(turn.aconsume(stream)):
+            yield response
+
+        if turn.finish_reason=="tool_calls":
+            message = turn.message()
+            messages.append(message)
+            messages += await dispatcher.adispatch(message["tool_calls"])
+            stream = stream_completion(session, model=MODEL, messages=messages)
+            async for response in coalesce(StreamedTurn().aconsume(stream), prefix=response):
+                yield response
+    finally:
+        crawler.prefetcher.release(prefetched)
+
+def website_brochure_tool(destination_website_url):
+    return {"destination_website_url": destination_website_url, "brochure": get_website_brochure(destination_website_url)}
 
 def get_website_brochure(destination_website_url):
-    print(f"Tool get_website_brochure called for {destination_website_url}")
-    destination_website_url = destination_website_url.lower()
+    log.debug("Tool get_website_brochure called for %s", destination_website_url)
+    destination_website_url = site_url(destination_website_url)
     return create_brochure(destination_website_url, destination_website_url)
 
 brochure_function = {
@@ -74,35 +73,10 @@ brochure_function = {
 # And this is included in a list of tools:
 tools = [{"type": "function", "function": brochure_function}]
 
+# Tool name -> implementation; every tool call of a turn runs concurrently
+dispatcher = ToolDispatcher({"get_website_brochure": website_brochure_tool})
 
-# Some websites need you to use proper headers when fetching them:
-headers = {
- "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
-}
 
-class Website:
-    """
-    A utility class to represent a Website that we have scraped, now with links
-    """
-
-    def __init__(self, url):
-        self.url = url
-        response = requests.get(url, headers=headers)
-        self.body = response.content
-        soup = BeautifulSoup(self.body, 'html.parser')
-        self.title = soup.title.string if soup.title else "No title found"
-        if soup.body:
-            for irrelevant in soup.body(["script", "style", "img", "input"]):
-                irrelevant.decompose()
-            self.text = soup.body.get_text(separator="\n", strip=True)
-        else:
-            self.text = ""
-        links = [link.get('href') for link in soup.find_all('a')]
-        self.links = [link for link in links if link]
-
-    def get_contents(self):
-        return f"Webpage Title:\n{self.title}\nWebpage Contents:\n{self.text}\n\n"
-    
 link_system_prompt = "You are provided with a list of links found on a webpage. \
 You are able to decide which of the links would be most relevant to include in a brochure about the company, \
 such as links to an About page, or a Company page, or Careers/Jobs pages.\n"
@@ -125,54 +99,66 @@ Do not include Terms of Service, Privacy, email links.\n"
     user_prompt += "\n".join(website.links)
     return user_prompt
 
-def get_links(url):
-    website = Website(url)
-    response = openai.chat.completions.create(
-        model=MODEL,
-        messages=[
-            {"role": "system", "content": link_system_prompt},
-            {"role": "user", "content": get_links_user_prompt(website)}
-      ],
-        response_format={"type": "json_object"}
-    )
-    result = response.choices[0].message.content
-    return json.loads(result)
-
-def get_all_details(url):
-    print("Getting all details for URL: ", url)
-    result = "Landing page:\n"
-    result += Website(url).get_contents()
-    links = get_links(url)
-    print("Found links:", links)
-    for link in links["links"]:
-        result += f"\n\n{link['type']}\n"
-        result += Website(link["url"]).get_contents()
-    return result
+DETAILS_TOKEN_BUDGET = 6000  # tokens of website details sent to the model
+
+def already_written(url):
+    url = site_url(url)
+    return brochure_cache.get(f"{url}|{normalize_url(url)}") is not None or crawler.is_cached(url)
+
+# The landing page, link selection and sub-pages of a site, shared by concurrent questions about it
+crawler = SiteCrawler("brochure", MODEL, link_system_prompt, get_links_user_prompt, "brochure_pages", skip=already_written)
+
+def get_all_details(url, token_budget=DETAILS_TOKEN_BUDGET, pages=None):
+    return pack_pages(pages or crawler.get_all_pages(url), token_budget, MODEL)
 
 system_prompt = "You are an assistant that analyzes the contents of several relevant pages from a company website \
 and creates a short brochure about the company for prospective customers, investors and recruits. Respond in markdown.\
 Include details of company culture, customers and careers/jobs if you have the information."
 
-def get_brochure_user_prompt(company_name, url):
+BROCHURE_TOKEN_BUDGET = 3000  # tokens of the whole brochure user prompt
+
+def get_brochure_user_prompt(company_name, url, pages=None):
     user_prompt = f"You are looking at a company called: {company_name}\n"
     user_prompt += f"Here are the contents of its landing page and other relevant pages; use this information to build a short brochure of the company in markdown.\n"
-    user_prompt += get_all_details(url)
-    user_prompt = user_prompt[:10_000] # Truncate if more than 10,000 characters
+    user_prompt += get_all_details(url, BROCHURE_TOKEN_BUDGET - count_tokens(user_prompt, MODEL), pages)
     return user_prompt
 
 #print(get_brochure_user_prompt("HuggingFace", "https://huggingface.co"))
 
+# Finished brochures, keyed by company name and normalized url
+brochure_cache = CrawlCache("brochures")
+
+# Brochures being written, by the same key
+brochures_in_progress = SingleFlight("brochure")
+
 def create_brochure(company_name, url):
-    response = openai.chat.completions.create(
-        model=MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": get_brochure_user_prompt(company_name, url)}
-          ],
-    )
+    cache_key = f"{company_name}|{normalize_url(url)}"
+    cached = brochure_cache.get(cache_key)
+    if cached is not None:
+        log.debug("Using cached brochure for %s", url)
+        return cached
+    return brochures_in_progress.do(cache_key, lambda: write_brochure(company_name, url, cache_key))
+
+def write_brochure(company_name, url, cache_key, pages=None):
+    user_prompt = get_brochure_user_prompt(company_name, url, pages)
+    with span("model_call", MODEL, purpose="brochure", url=url) as model_call:
+        response = openai.chat.completions.create(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+              ],
+        )
+        record_usage(MODEL, response.usage)
+        model_call.set(prompt_tokens=response.usage.prompt_tokens, completion_tokens=response.usage.completion_tokens)
     result = response.choices[0].message.content
-    print(result)
+    log.debug("Brochure for %s:\n%s", url, result)
+    brochure_cache.put(cache_key, result)
     return result
     #display(Markdown(result))
 
-gr.ChatInterface(fn=chat, type="messages").launch(inbrowser=True, share=True, debug=True)
\ No newline at end of file
+def launch():
+    gr.ChatInterface(fn=chat, type="messages").launch(inbrowser=True, share=True, debug=True)
+
+if __name__ == "__main__":
+    launch()
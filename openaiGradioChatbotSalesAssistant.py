@@ -1,49 +1,54 @@
-import os
-from dotenv import load_dotenv
-from openai import OpenAI
+import logging
 import gradio as gr
-
-load_dotenv(override=True)
-openai_api_key = os.getenv('OPENAI_API_KEY')
-google_api_key = os.getenv('GOOGLE_API_KEY')
-
-
-if openai_api_key:
-    print(f"OpenAI API Key exists and begins {openai_api_key[:8]}")
-else:
-    print("OpenAI API Key not set")
-    
-if google_api_key:
-    print(f"Google API Key exists and begins {google_api_key[:8]}")
-else:
-    print("Google API Key not set")
+from bootstrap import initialize
+from chatStreaming import StreamedTurn, coalesce
+from asyncChat import stream_completion, session_id
+from historyManager import HistoryManager
+from answerCache import AnswerCache
 
 # Initialize
-openai = OpenAI()
+initialize("OPENAI_API_KEY", "GOOGLE_API_KEY")
+log = logging.getLogger(__name__)
 MODEL = 'gpt-4o-mini'
 
+history_manager = HistoryManager(MODEL)
+
 system_message = "You are a helpful assistant in a clothes store. You should try to gently encourage \
 the customer to try items that are on sale. Hats are 60% off, and most other items are 50% off. \
 For example, if the customer says 'I'm looking to buy a hat', \
 you could reply something like, 'Wonderful - we have lots of hats - including several that are part of our sales event.'\
 Encourage the customer to buy hats if they are unsure what to get."
 
-def chat(message, history):
+# Repeat questions are answered without a model call; the system prompt and model are part of every key
+answer_cache = AnswerCache("sales_answers", version=lambda: MODEL)
+
+async def chat(message, history, request: gr.Request = None):
+    session = session_id(request)
 
     relevant_system_message = system_message
     if 'belt' in message:
         relevant_system_message += " The store does not sell belts; if you are asked for belts, be sure to point out other items on sale."
+
+    cached = answer_cache.lookup(relevant_system_message, message, history)
+    if cached is not None:
+        log.debug("Answer cache hit, hit rate %.0f%%", answer_cache.get_stats()["hit_rate"] * 100)
+        yield cached
+        return
     
-    messages = [{"role": "system", "content": relevant_system_message}] + history + [{"role": "user", "content": message}]
+    messages = [{"role": "system", "content": relevant_system_message}] + await history_manager.compact(history, session) + [{"role": "user", "content": message}]
 
-    stream = openai.chat.completions.create(model=MODEL, messages=messages, stream=True)
+    stream = stream_completion(session, model=MODEL, messages=messages)
 
     response = ""
-    for chunk in stream:
-        response += chunk.choices[0].delta.content or ''
+    async for response in coalesce(StreamedTurn().aconsume(stream)):
         yield response
+    answer_cache.store(relevant_system_message, message, history, response)
 
 system_message += "\nIf the customer asks for shoes, you should respond that shoes are not on sale today, \
 but remind the customer to look at hats!"
 
-gr.ChatInterface(fn=chat, type="messages").launch()
\ No newline at end of file
+def launch():
+    gr.ChatInterface(fn=chat, type="messages").launch()
+
+if __name__ == "__main__":
+    launch()
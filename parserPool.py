@@ -0,0 +1,113 @@
+# imports
+import os
+import signal
+import logging
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from htmlExtractor import extract_page, CHUNK_SIZE
+from telemetry import Counter, METRICS
+
+log = logging.getLogger(__name__)
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", min(4, os.cpu_count() or 1)))  # parser processes; 0 parses every page in process
+INLINE_BYTES = int(os.getenv("PARSE_INLINE_BYTES", 64 * 1024))  # bodies up to this size are parsed in process
+SHARED_MEMORY_BYTES = 256 * 1024  # bodies from this size reach a worker through shared memory, not a pickled copy
+PARSE_TIMEOUT = 10  # seconds a parse may take in a worker when the caller has no deadline of its own
+
+pages_parsed_total = Counter("chatbot_pages_parsed_total", "Page bodies parsed, by where they were parsed", ("where",))
+METRICS.append(pages_parsed_total)
+
+def _parse(body, encoding):
+    chunks = (body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+    return extract_page(chunks, encoding, max_bytes=len(body))
+
+def _parse_shared(name, size, encoding):
+    # Runs in a worker: copies the body out of the parent's block and lets go of it before parsing
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        body = bytes(memory.buf[:size])
+    finally:
+        memory.close()
+    return _parse(body, encoding)
+
+def _init_worker():
+    # Ctrl+C is for the parent, which shuts the pool down; the workers would only print tracebacks
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Workers are spawned rather than forked: a fork of this threaded process could inherit a held lock.
+            # A spawned worker imports the parent's __main__ again, as __mp_main__; bootstrap.initialize
+            # leaves the metrics server and key report to the parent there.
+            _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker)
+        return _pool
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _result(future, timeout):
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        # A parse still waiting for a worker is dropped; one already running can't be: its worker is stuck or busy
+        raise FutureTimeout(not future.cancel())
+
+def _offload(pool, body, encoding, timeout):
+    if len(body) < SHARED_MEMORY_BYTES:
+        return _result(pool.submit(_parse, body, encoding), timeout), "pool"
+    memory = shared_memory.SharedMemory(create=True, size=len(body))
+    try:
+        memory.buf[:len(body)] = body
+        return _result(pool.submit(_parse_shared, memory.name, len(body), encoding), timeout), "shared_memory"
+    finally:
+        memory.close()
+        memory.unlink()
+
+def parse_body(body, encoding="utf-8", timeout=None):
+    """
+    Extracts the title, visible text and links of a page body in a worker process, so the parse
+    doesn't hold the GIL of the serving process. Small bodies, which cost less to parse than to hand
+    over, are parsed in process, as is everything when PARSE_WORKERS is 0 or a worker died or didn't
+    answer in time.
+
+    Args:
+        body (bytes): The raw page body.
+        encoding (str): The character encoding of the body.
+        timeout (float): Seconds to wait for a worker, e.g. what is left of the page's time; PARSE_TIMEOUT if None.
+
+    Returns:
+        dict: The page title, visible text and links, as extract_page returns them.
+    """
+    if PARSE_WORKERS <= 0 or len(body) <= INLINE_BYTES:
+        pages_parsed_total.inc("inline")
+        return _parse(body, encoding)
+    pool = _get_pool()
+    try:
+        page, where = _offload(pool, body, encoding, PARSE_TIMEOUT if timeout is None else max(timeout, 0))
+    except BrokenProcessPool:
+        log.warning("A parser process died; parsing %d bytes in process", len(body))
+        _discard_pool(pool)
+        pages_parsed_total.inc("fallback")
+        return _parse(body, encoding)
+    except FutureTimeout as error:
+        log.warning("No parser process answered in time; parsing %d bytes in process", len(body))
+        if error.args[0]:
+            # Later pages get a new pool; the old one's workers exit once they finish what they are parsing
+            _discard_pool(pool)
+        pages_parsed_total.inc("timeout")
+        return _parse(body, encoding)
+    pages_parsed_total.inc(where)
+    return page
@@ -0,0 +1,146 @@
+# imports
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from crawlCache import normalize_url, find_urls
+from telemetry import Counter, METRICS, span
+
+log = logging.getLogger(__name__)
+
+MAX_URLS = 2        # urls of one message that are prefetched
+MAX_IN_FLIGHT = 4   # prefetches queued or running at once, per prefetcher; more urls are not prefetched
+WORKERS = 2         # prefetches running at once, per prefetcher
+
+prefetches_total = Counter("chatbot_prefetches_total", "Speculative prefetches by outcome", ("prefetcher", "outcome"))
+METRICS.append(prefetches_total)
+
+class _Prefetch:
+    __slots__ = ("future", "cancelled", "holders", "taken")
+
+    def __init__(self):
+        self.future, self.cancelled, self.holders, self.taken = None, threading.Event(), 0, False
+
+class Prefetcher:
+    """
+    Starts work for the urls in a user message in the background, while the model is still deciding
+    whether to call a tool for them. The tool then takes the prefetched result instead of doing the
+    work again; prefetches nobody took by the time the turn ends are cancelled.
+
+    A turn calls start(message) before its first completion and release(keys) when it is done. The
+    cost is bounded: at most max_urls urls per message and max_in_flight prefetches at a time, on
+    workers threads, and a cancelled prefetch is told to stop at its next stage.
+    """
+
+    def __init__(self, name, function, skip=None, canonical=None, max_urls=MAX_URLS, max_in_flight=MAX_IN_FLIGHT,
+                 workers=WORKERS):
+        """
+        Args:
+            name (str): Labels this prefetcher in the chatbot_prefetches_total metric.
+            function (callable): function(url, cancelled) does the work for url. cancelled is a
+                threading.Event that is set when the prefetch is no longer wanted; the function should
+                check it between stages and return early.
+            skip (callable): skip(url) is True when prefetching url is pointless, e.g. it is cached.
+            canonical (callable): canonical(url) is the url as the tool will spell it. Prefetches run
+                on and are keyed by it, so the tool's take() finds them.
+        """
+        self.name, self.function, self.skip = name, function, skip
+        self.canonical = canonical or (lambda url: url)
+        self.max_urls, self.max_in_flight = max_urls, max_in_flight
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.prefetches = {}  # normalized url -> _Prefetch
+        self.lock = threading.Lock()
+        self.stats = {"started": 0, "hits": 0, "wasted": 0, "skipped": 0, "failed": 0}
+
+    def _count(self, outcome):
+        with self.lock:
+            self.stats[outcome] += 1
+        prefetches_total.inc(self.name, outcome)
+
+    def _run(self, url, cancelled):
+        if cancelled.is_set():
+            return None
+        with span("prefetch", self.name, url=url):
+            return self.function(url, cancelled)
+
+    def start(self, message):
+        """
+        Starts prefetching the urls in message, or joins prefetches of them already running.
+
+        Returns:
+            list: Keys of the prefetches this turn holds, to pass to release.
+        """
+        keys = []
+        for url in find_urls(message, self.max_urls):
+            url = self.canonical(url)
+            key = normalize_url(url)
+            if key in keys:
+                continue
+            with self.lock:
+                prefetch = self.prefetches.get(key)
+            if prefetch is None and self.skip and self.skip(url):
+                self._count("skipped")
+                continue
+            with self.lock:
+                prefetch = self.prefetches.get(key)
+                if prefetch is None:
+                    in_flight = sum(not each.future.done() for each in self.prefetches.values())
+                    if in_flight >= self.max_in_flight:
+                        prefetch = None
+                    else:
+                        prefetch = self.prefetches[key] = _Prefetch()
+                        prefetch.future = self.executor.submit(contextvars.copy_context().run,
+                                                               self._run, url, prefetch.cancelled)
+                        self.stats["started"] += 1
+                if prefetch is not None:
+                    prefetch.holders += 1
+            if prefetch is None:
+                self._count("skipped")
+                continue
+            keys.append(key)
+        return keys
+
+    def take(self, url):
+        """
+        Returns the prefetched result for url, waiting for it if it is still running, or None if url
+        was not prefetched or its prefetch failed.
+        """
+        with self.lock:
+            prefetch = self.prefetches.get(normalize_url(self.canonical(url)))
+            if prefetch is None:
+                return None
+            first, prefetch.taken = not prefetch.taken, True
+        try:
+            result = prefetch.future.result()
+        except (Exception, CancelledError) as error:
+            log.debug("Prefetch of %s failed: %r", url, error)
+            if first:
+                self._count("failed")
+            return None
+        if first:
+            self._count("hits")
+        return result
+
+    def release(self, keys):
+        """
+        Drops a turn's hold on its prefetches; one that no turn holds any more and nobody took is cancelled.
+        """
+        for key in keys:
+            with self.lock:
+                prefetch = self.prefetches[key]
+                prefetch.holders -= 1
+                if prefetch.holders:
+                    continue
+                del self.prefetches[key]
+            if not prefetch.taken:
+                prefetch.cancelled.set()
+                prefetch.future.cancel()
+                self._count("wasted")
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        finished = stats["hits"] + stats["wasted"] + stats["failed"]
+        stats["hit_rate"] = stats["hits"] / finished if finished else 0.0
+        stats["waste_rate"] = stats["wasted"] / finished if finished else 0.0
+        return stats
@@ -0,0 +1,96 @@
+# imports
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import Future
+from telemetry import Counter, METRICS
+
+coalesced_total = Counter("chatbot_coalesced_total", "Calls that waited for an identical call already in progress",
+                          ("flight",))
+METRICS.append(coalesced_total)
+
+class SingleFlight:
+    """
+    Runs a call once per key at a time: while the call for a key is in progress, later callers with
+    the same key wait for its result (or exception) instead of starting their own.
+
+    Waiting is cancellation safe: a waiter that gives up, times out or is cancelled only stops
+    waiting. The call itself always runs to the end, so its result still reaches the other waiters
+    and whatever caches it fills.
+    """
+
+    def __init__(self, name):
+        """
+        Args:
+            name (str): Labels this flight's calls in the chatbot_coalesced_total metric.
+        """
+        self.name = name
+        self.calls = {}  # key -> Future of the call in progress
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def _join(self, key):
+        """
+        Returns:
+            tuple: (future of the call for key, True if the caller must run the call)
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                coalesced_total.inc(self.name)
+                return future, False
+            self.stats["calls"] += 1
+            future = self.calls[key] = Future()
+            # A running future can't be cancelled, so no waiter can cancel the call for the others
+            future.set_running_or_notify_cancel()
+            return future, True
+
+    def _lead(self, key, future, function):
+        try:
+            result = function()
+        except BaseException as error:
+            with self.lock:
+                del self.calls[key]
+            future.set_exception(error)
+            if not isinstance(error, Exception):
+                raise
+        else:
+            with self.lock:
+                del self.calls[key]
+            future.set_result(result)
+
+    def do(self, key, function, timeout=None):
+        """
+        Calls function(), or waits for the call already in progress for key.
+
+        Args:
+            key: Any hashable value identifying the call, e.g. a normalized url.
+            function (callable): Takes no arguments.
+            timeout (float): Seconds a waiter waits before giving up with TimeoutError; the call
+                itself is not limited.
+
+        Returns:
+            Whatever the call returned; an exception it raised is raised in every caller.
+        """
+        future, leader = self._join(key)
+        if leader:
+            self._lead(key, future, function)
+        return future.result(timeout)
+
+    async def ado(self, key, function, executor=None):
+        """
+        Like do, for async callers: a new call runs on executor (the loop's default one if None) and
+        waiters don't hold a thread. Cancelling the awaiting task never cancels the call.
+        """
+        future, leader = self._join(key)
+        if leader:
+            asyncio.get_running_loop().run_in_executor(executor, contextvars.copy_context().run,
+                                                       self._lead, key, future, function)
+        return await asyncio.wrap_future(future)
+
+    def get_stats(self):
+        with self.lock:
+            calls, coalesced = self.stats["calls"], self.stats["coalesced"]
+        return {"calls": calls, "coalesced": coalesced,
+                "coalesced_rate": coalesced / (calls + coalesced) if calls + coalesced else 0.0}
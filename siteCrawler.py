@@ -0,0 +1,107 @@
+# imports
+import json
+import logging
+from bootstrap import openai, lazy_import
+from crawlCache import CrawlCache, normalize_url, content_hash
+from telemetry import span, record_usage
+from singleFlight import SingleFlight
+from prefetcher import Prefetcher
+
+log = logging.getLogger(__name__)
+
+# The scraper (requests, urllib3) is only loaded the first time a crawl fetches a website
+websiteScraper = lazy_import("websiteScraper")
+
+def site_url(url):
+    """
+    Returns url as the tools spell it: lowercased, as the model's capitalization of a url varies.
+    """
+    return url.lower()
+
+class SiteCrawler:
+    """
+    The website crawl the RAG bots share: a site's landing page, the links a model picks from it, and
+    those pages, cached per site. Concurrent crawls of one site share a single crawl, and the landing
+    page of a url in a user message can be prefetched while the model decides whether to call a tool
+    for it; the links are only chosen, with a model call, once the tool does.
+    """
+
+    def __init__(self, name, model, link_system_prompt, link_user_prompt, pages_cache, skip=None):
+        """
+        Args:
+            name (str): Labels the crawler's prefetches and in-progress crawls in the metrics.
+            model (str): The model that picks the links.
+            link_system_prompt (str): The system prompt of the link selection.
+            link_user_prompt (callable): link_user_prompt(website) returns its user prompt.
+            pages_cache (str): Name of the cache of crawled pages, keyed by normalized url.
+            skip (callable): skip(url) is True when prefetching url is pointless; by default, when
+                its pages are cached.
+        """
+        self.model = model
+        self.link_system_prompt, self.link_user_prompt = link_system_prompt, link_user_prompt
+        # Link selections, keyed by the model, the prompt and the page's link set
+        self.links_cache = CrawlCache("link_selection")
+        self.pages_cache = CrawlCache(pages_cache)
+        # Crawls in progress, by normalized url: concurrent questions about one site share a crawl
+        self.crawls = SingleFlight(f"{name}_pages")
+        self.prefetcher = Prefetcher(name, self.prefetch_landing, skip=skip or self.is_cached, canonical=site_url)
+
+    def is_cached(self, url):
+        return self.pages_cache.get(normalize_url(url)) is not None
+
+    def get_links(self, url, website=None):
+        website = website or websiteScraper.fetch_website(url, timeout=websiteScraper.PAGE_TIMEOUT)
+        cache_key = content_hash(self.model, self.link_system_prompt, normalize_url(website.url),
+                                 sorted({link.strip() for link in website.links}))
+        cached = self.links_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        with span("link_selection", self.model, url=url, links=len(website.links)) as selection:
+            response = openai.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": self.link_system_prompt},
+                    {"role": "user", "content": self.link_user_prompt(website)}
+                ],
+                response_format={"type": "json_object"}
+            )
+            record_usage(self.model, response.usage)
+            result = json.loads(response.choices[0].message.content)
+            selection.set(selected=len(result.get("links", [])))
+        self.links_cache.put(cache_key, result)
+        return result
+
+    def prefetch_landing(self, url, cancelled):
+        # Only the download and the page's links: a speculative prefetch never spends a model call
+        return websiteScraper.fetch_website(url, timeout=websiteScraper.PAGE_TIMEOUT)
+
+    def get_all_pages(self, url):
+        cache_key = normalize_url(url)
+        cached = self.pages_cache.get(cache_key)
+        if cached is not None:
+            log.debug("Using cached pages for %s", url)
+            return cached
+        return self.crawls.do(cache_key, lambda: self.crawl_pages(url, cache_key))
+
+    def crawl_pages(self, url, cache_key):
+        log.debug("Getting all pages for %s", url)
+        landing_page = self.prefetcher.take(url) or websiteScraper.fetch_website(url, timeout=websiteScraper.PAGE_TIMEOUT)
+        return self.fetch_pages(landing_page, self.get_links(url, landing_page), cache_key)
+
+    def fetch_pages(self, landing_page, links, cache_key):
+        """
+        Fetches the links chosen from a landing page and returns them with it as the pages of the site,
+        caching them under cache_key unless one of them could not be fetched.
+        """
+        pages = [{"type": "Landing page", "title": landing_page.title, "text": landing_page.text}]
+        log.debug("Found links: %s", links)
+        fetched = websiteScraper.fetch_websites([link["url"] for link in links["links"]])
+        for link, page in zip(links["links"], fetched):
+            if page.error:
+                log.warning("Could not fetch %s: %s", page.url, page.error)
+                pages.append({"type": link["type"], "title": page.url, "text": f"Could not fetch page: {page.error}"})
+            else:
+                pages.append({"type": link["type"], "title": page.website.title, "text": page.website.text})
+        if not any(page.error for page in fetched):
+            self.pages_cache.put(cache_key, pages)
+        return pages
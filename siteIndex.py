@@ -0,0 +1,201 @@
+# imports
+import os
+import re
+import json
+import math
+import zlib
+import threading
+from collections import Counter, OrderedDict
+from bootstrap import lazy_import
+from crawlCache import CACHE_DIR, CrawlCache, normalize_url, content_hash, find_urls
+from fileCache import FileCache
+
+# NumPy is only loaded once a site is indexed or searched
+np = lazy_import("numpy")
+
+INDEX_DIR = os.path.join(CACHE_DIR, "site_index")
+CHUNK_WORDS = 120  # paragraphs are grouped into chunks of about this many words
+TOP_K = 4
+MAX_INDEXES = 256  # site indexes kept in memory, least recently used are dropped
+INDEX_MAX_BYTES = int(os.getenv("SITE_INDEX_MAX_BYTES", 256 * 1024 * 1024))  # on-disk indexes, least recently used are deleted
+
+_word = re.compile(r"\w+")
+
+class HashingEmbedder:
+    """
+    An offline embedder: hashed bag of words with sublinear term frequency, L2 normalized.
+    Needs no network or model, so it is also what tests use.
+    """
+
+    def __init__(self, dimensions=1024):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word, count in Counter(_word.findall(text.lower())).items():
+                bucket = zlib.crc32(word.encode("utf-8"))
+                sign = 1.0 if bucket & 0x80000000 else -1.0
+                matrix[row, bucket % self.dimensions] += sign * (1 + math.log(count))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+class OpenAIEmbedder:
+    """
+    Semantic embeddings from the OpenAI embeddings endpoint
+    """
+
+    def __init__(self, client, model="text-embedding-3-small"):
+        self.client = client
+        self.model = model
+        self.name = model
+
+    def embed(self, texts):
+        response = self.client.embeddings.create(model=self.model, input=texts)
+        matrix = np.array([item.embedding for item in response.data], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+def chunk_pages(pages, chunk_words=CHUNK_WORDS):
+    """
+    Groups the paragraphs of each page into chunks of about chunk_words words.
+
+    Returns:
+        list: dicts with the page type, title and chunk text.
+    """
+    chunks = []
+    for page in pages:
+        current, words = [], 0
+        for line in page["text"].split("\n"):
+            line = line.strip()
+            if not line:
+                continue
+            current.append(line)
+            words += len(line.split())
+            if words >= chunk_words:
+                chunks.append({"type": page["type"], "title": page["title"], "text": "\n".join(current)})
+                current, words = [], 0
+        if current:
+            chunks.append({"type": page["type"], "title": page["title"], "text": "\n".join(current)})
+    return chunks
+
+class SiteIndex:
+    """
+    The chunks of one scraped site and their embeddings, searchable by cosine similarity
+    """
+
+    def __init__(self, chunks, matrix, embedder):
+        self.chunks = chunks
+        self.matrix = matrix
+        self.embedder = embedder
+
+    @classmethod
+    def build(cls, pages, embedder):
+        chunks = chunk_pages(pages)
+        matrix = embedder.embed([chunk["text"] for chunk in chunks]) if chunks else np.zeros((0, 1), np.float32)
+        return cls(chunks, matrix, embedder)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".json", "w") as f:
+            json.dump(self.chunks, f)
+        # The matrix marks the index as complete, so it is written last and replaced in one step
+        temporary = f"{path}.npy.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            np.save(f, self.matrix)
+        os.replace(temporary, path + ".npy")
+
+    @classmethod
+    def load(cls, path, embedder):
+        # The matrix stays on disk and is paged in as searches touch it
+        matrix = np.load(path + ".npy", mmap_mode="r")
+        with open(path + ".json") as f:
+            chunks = json.load(f)
+        return cls(chunks, matrix, embedder)
+
+    def search(self, query, k=TOP_K):
+        """
+        Returns the k chunks most similar to query, best first, as (score, chunk) pairs.
+        """
+        if not self.chunks:
+            return []
+        scores = self.matrix @ self.embedder.embed([query])[0]
+        k = min(k, len(self.chunks))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.chunks[i]) for i in top]
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+# Saved indexes, one .npy matrix and .json chunks pair per embedder and page set
+_index_files = FileCache("site_index", ".npy", max_bytes=INDEX_MAX_BYTES, companions=(".json",))
+# Normalized url -> the saved index of its latest pages, so indexes are found again after a restart
+_site_indexes = CrawlCache("site_indexes")
+
+def _remember(key, index):
+    with _indexes_lock:
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+
+def _load(index_key, embedder):
+    path = _index_files.get(index_key)
+    if path is None:
+        return None
+    try:
+        return SiteIndex.load(path[:-len(".npy")], embedder)
+    except (OSError, ValueError):
+        # Evicted or only half there
+        return None
+
+def index_site(url, pages, embedder):
+    """
+    Builds (or loads from disk) the index for a site's pages and remembers it for get_site_index.
+    """
+    key = normalize_url(url)
+    index_key = content_hash(embedder.name, pages)
+    index = _load(index_key, embedder)
+    if index is None:
+        index = SiteIndex.build(pages, embedder)
+        index.save(os.path.join(INDEX_DIR, index_key))
+        _index_files.add(index_key)
+    _site_indexes.put(key, {"index": index_key, "embedder": embedder.name})
+    _remember(key, index)
+    return index
+
+def get_site_index(url, embedder=None):
+    """
+    Returns the index of url's pages, or None. One that is not in memory is loaded from disk if it
+    was built with embedder.
+    """
+    key = normalize_url(url)
+    with _indexes_lock:
+        if key in _indexes:
+            _indexes.move_to_end(key)
+            return _indexes[key]
+    saved = _site_indexes.get(key) if embedder is not None else None
+    if saved is None or saved["embedder"] != embedder.name:
+        return None
+    index = _load(saved["index"], embedder)
+    if index is not None:
+        _remember(key, index)
+    return index
+
+def retrieve_context(message, history, k=TOP_K, embedder=None):
+    """
+    Finds the most recent website the conversation is about that has been indexed and returns the
+    top-k chunks relevant to message, formatted for a system message, or None. With embedder, sites
+    indexed before a restart are found on disk too.
+    """
+    texts = [message] + [m["content"] for m in reversed(history) if isinstance(m.get("content"), str)]
+    for text in texts:
+        for url in reversed(find_urls(text)):
+            index = get_site_index(url.lower(), embedder)
+            if index is None:
+                continue
+            excerpts = [f"{chunk['type']} - {chunk['title']}:\n{chunk['text']}" for _, chunk in index.search(message, k)]
+            return f"Relevant excerpts already gathered from {url}:\n\n" + "\n\n".join(excerpts)
+    return None
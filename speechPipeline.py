@@ -0,0 +1,86 @@
+# imports
+import re
+import logging
+from collections import deque
+
+# A sentence ends at . ! ? (and closing quotes/brackets) followed by whitespace
+_sentence_end = re.compile(r"[.!?…]+[\"')\]]*\s+")
+MIN_SENTENCE_CHARS = 12  # shorter sentences are joined to the next, e.g. "Sure."
+
+log = logging.getLogger(__name__)
+
+class SentenceSplitter:
+    """
+    Splits streamed text into complete sentences as soon as each one ends
+    """
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text):
+        """
+        Adds a piece of text and returns the sentences it completed.
+        """
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in _sentence_end.finditer(self.buffer):
+            if match.end() - start >= MIN_SENTENCE_CHARS:
+                sentences.append(self.buffer[start:match.end()].strip())
+                start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        """
+        Returns whatever text is left as a final sentence.
+        """
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
+
+class SpeechPipeline:
+    """
+    Synthesizes a reply sentence by sentence while it is still being written, and hands out the clips
+    in reply order as they become ready
+    """
+
+    def __init__(self, executor, synthesize):
+        """
+        Args:
+            executor: Where synthesize runs.
+            synthesize: Function turning one sentence into an audio clip (e.g. a file path).
+        """
+        self.executor = executor
+        self.synthesize = synthesize
+        self.splitter = SentenceSplitter()
+        self.clips = deque()  # futures of the clips, in reply order
+
+    def feed(self, text):
+        for sentence in self.splitter.feed(text):
+            self.clips.append(self.executor.submit(self.synthesize, sentence))
+
+    def finish(self):
+        for sentence in self.splitter.flush():
+            self.clips.append(self.executor.submit(self.synthesize, sentence))
+
+    def pending(self):
+        return bool(self.clips)
+
+    def next_clip(self):
+        """
+        Returns the future of the next clip to play, or None.
+        """
+        return self.clips[0] if self.clips else None
+
+    def ready(self):
+        """
+        Returns the clips that are ready to play now, keeping reply order; failed clips are skipped.
+        """
+        ready = []
+        while self.clips and self.clips[0].done():
+            future = self.clips.popleft()
+            try:
+                ready.append(future.result())
+            except Exception as error:
+                log.warning("Could not synthesize speech: %r", error)
+        return ready
@@ -0,0 +1,189 @@
+# imports
+import os
+import json
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Share of root spans whose trace (the span and its children) is logged; metrics cover every span.
+# Both settings are read again by configure(), once .env is loaded.
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+METRICS_PORT = os.getenv("METRICS_PORT")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+trace_log = logging.getLogger("chatbots.trace")
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.labels = name, help, labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self.series = {}  # label values -> [count per bucket..., count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_values, series in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), label_values + ('+Inf',))} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {series[-2]}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {series[-1]:.6f}")
+        return lines
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values):
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}" if pairs else ""
+
+span_seconds = Histogram("chatbot_span_seconds", "Duration of instrumented operations", ("span", "target", "status"))
+first_token_seconds = Histogram("chatbot_model_first_token_seconds", "Time to the first streamed chunk", ("model",))
+tokens_total = Counter("chatbot_tokens_total", "Tokens used by model calls", ("model", "kind"))
+METRICS = [span_seconds, first_token_seconds, tokens_total]
+
+class Span:
+    """
+    What a span() block can add to: attributes are only kept when the trace is sampled.
+    """
+
+    __slots__ = ("name", "target", "trace_id", "span_id", "parent_id", "sampled", "attributes")
+
+    def __init__(self, name, target, parent):
+        self.name, self.target = name, target
+        self.sampled = parent.sampled if parent else random.random() < TRACE_SAMPLE_RATE
+        if self.sampled:
+            self.trace_id = parent.trace_id if parent else f"{random.getrandbits(64):016x}"
+            self.span_id = f"{random.getrandbits(32):08x}"
+            self.parent_id = parent.span_id if parent else None
+            self.attributes = {}
+
+    def set(self, **attributes):
+        if self.sampled:
+            self.attributes.update(attributes)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+def start_span(name, target=""):
+    """
+    Starts a span without making it current: for spans that outlive a block, e.g. across the
+    yields of a stream. Finish it with end_span.
+    """
+    return Span(name, target, _current_span.get()), time.perf_counter()
+
+def end_span(started, error=None):
+    span, start = started
+    duration = time.perf_counter() - start
+    status = "ok" if not error else "cancelled" if error in ("CancelledError", "GeneratorExit") else "error"
+    span_seconds.observe(duration, span.name, span.target, status)
+    if span.sampled:
+        record = {"trace": span.trace_id, "span": span.span_id, "parent": span.parent_id, "name": span.name,
+                  "target": span.target, "ms": round(duration * 1000, 3), **span.attributes}
+        if error:
+            record["error"] = error
+        trace_log.info(json.dumps(record, default=str))
+
+@contextmanager
+def span(name, target="", **attributes):
+    """
+    Times the block into the chatbot_span_seconds histogram and, if the trace is sampled, logs it
+    with its attributes. Spans opened inside the block (in the same thread or task) are its children.
+    """
+    started = start_span(name, target)
+    started[0].set(**attributes)
+    token = _current_span.set(started[0])
+    error = None
+    try:
+        yield started[0]
+    except BaseException as exception:
+        error = type(exception).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        end_span(started, error)
+
+def record_usage(model, usage):
+    """
+    Adds the token usage of a model call (the API's usage object) to chatbot_tokens_total.
+    """
+    if usage is None:
+        return
+    tokens_total.inc(model, "prompt", amount=usage.prompt_tokens or 0)
+    tokens_total.inc(model, "completion", amount=usage.completion_tokens or 0)
+
+def render_metrics():
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_metrics().encode() if self.path.split("?")[0] == "/metrics" else b""
+        self.send_response(200 if body else 404)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def configure():
+    """
+    Reads TRACE_SAMPLE_RATE and METRICS_PORT from the environment and starts the metrics server if a
+    port is set.
+    """
+    global TRACE_SAMPLE_RATE, METRICS_PORT
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+    METRICS_PORT = os.getenv("METRICS_PORT")
+    start_metrics_server()
+
+_server = None
+
+def start_metrics_server(port=None):
+    """
+    Serves the metrics in the Prometheus text format at http://<host>:<port>/metrics on a background
+    thread. Without a port, METRICS_PORT is used; if that is unset too, nothing is started.
+    """
+    global _server
+    port = port or METRICS_PORT
+    if _server is not None or not port:
+        return _server
+    _server = ThreadingHTTPServer((os.getenv("METRICS_HOST", "127.0.0.1"), int(port)), _MetricsHandler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+    logging.getLogger(__name__).info("Metrics at http://%s:%s/metrics", *_server.server_address[:2])
+    return _server
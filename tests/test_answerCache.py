@@ -0,0 +1,41 @@
+# Tests: which questions the answer cache answers from an answer given to another question
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("CHATBOT_CACHE_DIR", tempfile.mkdtemp(prefix="chatbot-tests-"))
+from answerCache import AnswerCache
+
+SYSTEM = "You are a helpful assistant in a clothes store."
+
+class AnswerCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = AnswerCache(f"test_answers_{self.id()}", key_terms=lambda: {"london", "paris"})
+
+    def test_rephrased_question_reuses_the_answer(self):
+        self.cache.store(SYSTEM, "How much is a ticket to London?", [], "$799")
+        self.assertEqual(self.cache.lookup(SYSTEM, "London ticket price, please", []), "$799")
+
+    def test_other_key_term_is_not_answered(self):
+        self.cache.store(SYSTEM, "How much is a ticket to London?", [], "$799")
+        self.assertIsNone(self.cache.lookup(SYSTEM, "How much is a ticket to Paris?", []))
+
+    def test_negated_question_is_not_answered(self):
+        self.cache.store(SYSTEM, "I'm looking to buy a hat", [], "Our hats are on the second floor.")
+        for message in ("I'm not looking to buy a hat", "I don't want to buy a hat", "I'm looking to buy, but not a hat",
+                        "I'm looking to buy something without a hat"):
+            with self.subTest(message=message):
+                self.assertIsNone(self.cache.lookup(SYSTEM, message, []))
+
+    def test_negated_questions_match_each_other(self):
+        self.cache.store(SYSTEM, "I'm not looking to buy a hat", [], "No problem, what are you looking for?")
+        self.assertEqual(self.cache.lookup(SYSTEM, "not looking to buy a hat", []), "No problem, what are you looking for?")
+        self.assertIsNone(self.cache.lookup(SYSTEM, "I'm looking to buy a hat", []))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+# Tests: fare lookups price only the city a name is a spelling of; near misses are suggestions
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("CHATBOT_CACHE_DIR", tempfile.mkdtemp(prefix="chatbot-tests-"))
+from fareStore import FareStore
+
+FARES = """origin,destination,price,aliases
+,london,$799,london uk|londres|lhr
+,paris,$899,paris france
+,tokyo,$1400,tokio
+,berlin,$499,ber
+"""
+
+class FareStoreTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.directory.name, "fares.csv")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(FARES)
+        cls.store = FareStore(path, os.path.join(cls.directory.name, "fares.sqlite"))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.store.db.close()
+        cls.directory.cleanup()
+
+    def test_spellings_and_aliases_are_priced(self):
+        self.assertEqual(self.store.lookup("London"), {"city": "london", "price": "$799"})
+        self.assertEqual(self.store.lookup("London, UK"), {"city": "london", "price": "$799"})
+        self.assertEqual(self.store.lookup("Tokio"), {"city": "tokyo", "price": "$1400"})
+
+    def test_other_cities_containing_a_name_are_not_priced(self):
+        for name in ("Londonderry", "East London", "New London"):
+            with self.subTest(name=name):
+                self.assertIsNone(self.store.lookup(name))
+                self.assertIsNone(self.store.suggest_city(name))
+
+    def test_near_misses_are_suggested_not_priced(self):
+        for name, city in (("Londn", "london"), ("Berlinn", "berlin"), ("Tokyio", "tokyo"),
+                           ("London, Ontario", "london"), ("Paris, Texas", "paris")):
+            with self.subTest(name=name):
+                self.assertIsNone(self.store.lookup(name))
+                self.assertEqual(self.store.suggest_city(name), city)
+
+    def test_unrelated_names_get_nothing(self):
+        for name in ("Bern", "Madrid", ""):
+            with self.subTest(name=name):
+                self.assertIsNone(self.store.lookup(name))
+                self.assertIsNone(self.store.suggest_city(name))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+# Tests: connection reuse, ETag revalidation and the size bound of the shared HTTP session, against a local http.server
+#
+# Usage: python -m unittest discover tests
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("CHATBOT_CACHE_DIR", tempfile.mkdtemp(prefix="chatbot-tests-"))
+import httpSession
+
+ETAG = '"v1"'
+BODY = b"<html><head><title>Test</title></head><body>Hello</body></html>"
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the session can reuse its connection
+
+    def do_GET(self):
+        if self.path == "/etag" and self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(BODY)))
+        if self.path == "/etag":
+            self.send_header("ETag", ETAG)
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+class HttpSessionTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        httpSession.get_session().close()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_repeat_requests_reuse_the_connection(self):
+        before = httpSession.get_stats()
+        for _ in range(5):
+            response, page = httpSession.conditional_get(f"{self.base_url}/page", timeout=5)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(page)
+        after = httpSession.get_stats()
+        self.assertEqual(after["requests"] - before["requests"], 5)
+        self.assertLessEqual(after["connections_opened"] - before["connections_opened"], 1)
+        self.assertGreater(after["connections_reused"], before["connections_reused"])
+
+    def test_etag_revalidation_returns_the_stored_page(self):
+        url = f"{self.base_url}/etag"
+        parsed = {"title": "Test", "text": "Hello", "links": []}
+        response, page = httpSession.conditional_get(url, timeout=5)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(page)
+        httpSession.remember(url, response, parsed)
+
+        before = httpSession.get_stats()
+        response, page = httpSession.conditional_get(url, timeout=5)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(page, parsed)
+        self.assertEqual(httpSession.get_stats()["not_modified"] - before["not_modified"], 1)
+
+    def test_no_revalidation_without_a_validator(self):
+        url = f"{self.base_url}/page"
+        response, _ = httpSession.conditional_get(url, timeout=5)
+        httpSession.remember(url, response, {"title": "Test"})
+        before = httpSession.get_stats()
+        response, page = httpSession.conditional_get(url, timeout=5)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(page)
+        self.assertEqual(httpSession.get_stats()["not_modified"], before["not_modified"])
+
+class ValidatorStoreTest(unittest.TestCase):
+    def test_least_recently_used_pages_are_evicted_past_the_byte_cap(self):
+        store = httpSession.ValidatorStore("test_validators", memory_bytes=2000, disk_bytes=2000)
+        page = {"title": "Test", "text": "x" * 400, "links": []}
+        for i in range(10):
+            store.put(f"https://example.com/{i}", f'"v{i}"', None, page)
+        self.assertEqual(store.get("https://example.com/9"), ('"v9"', None, page))
+        self.assertEqual(store.get("https://example.com/0"), (None, None, None))
+        self.assertLessEqual(store.cache.get_stats()["disk_bytes"], 2000)
+
+if __name__ == "__main__":
+    unittest.main()
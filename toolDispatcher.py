@@ -0,0 +1,114 @@
+# imports
+import json
+import time
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from telemetry import span
+from singleFlight import SingleFlight
+
+log = logging.getLogger(__name__)
+
+MAX_WORKERS = 8     # tool calls run at the same time, across all conversations
+TOOL_TIMEOUT = 60   # seconds allowed for one tool call
+
+def _tool_call_parts(tool_call):
+    # Accepts both the dicts StreamedTurn builds and the SDK's tool call objects
+    if isinstance(tool_call, dict):
+        return tool_call["id"], tool_call["function"]["name"], tool_call["function"]["arguments"]
+    return tool_call.id, tool_call.function.name, tool_call.function.arguments
+
+def _flight_key(name, arguments):
+    # The same arguments spelt with other spacing or key order are the same call
+    try:
+        return name, json.dumps(json.loads(arguments or "{}"), sort_keys=True)
+    except json.JSONDecodeError:
+        return name, arguments
+
+class ToolDispatcher:
+    """
+    Runs every tool call of a model turn concurrently on a bounded, shared executor
+    """
+
+    def __init__(self, tools, max_workers=MAX_WORKERS, timeout=TOOL_TIMEOUT, single_flight=True):
+        """
+        Args:
+            tools (dict): Maps each tool name to the function that implements it. The function is called
+                with the tool call's arguments as keyword arguments and must return something JSON serializable.
+            max_workers (int): How many tool calls may run at the same time.
+            timeout (float): Seconds allowed for each tool call.
+            single_flight (bool): While a tool call is running, calls of the same tool with the same
+                arguments, from any conversation, wait for its result instead of running again. Only for
+                tools without side effects.
+        """
+        self.tools = dict(tools)
+        self.timeout = timeout
+        self.flights = SingleFlight("tool") if single_flight else None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+
+    def _run(self, name, arguments):
+        function = self.tools.get(name)
+        if function is None:
+            return {"error": f"Unknown tool called: {name}"}
+        try:
+            arguments = json.loads(arguments or "{}")
+        except json.JSONDecodeError as error:
+            return {"error": f"Invalid arguments for {name}: {error}"}
+        log.debug("Tool %s called with %s", name, arguments)
+        with span("tool", name) as tool_span:
+            try:
+                return function(**arguments)
+            except TypeError as error:
+                tool_span.set(error=repr(error))
+                return {"error": f"Bad arguments for {name}: {error}"}
+            except Exception as error:
+                log.warning("Tool %s failed: %r", name, error)
+                tool_span.set(error=repr(error))
+                return {"error": f"{name} failed: {error}"}
+
+    def _call(self, name, arguments):
+        if self.flights is None:
+            return self._run(name, arguments)
+        return self.flights.do(_flight_key(name, arguments), lambda: self._run(name, arguments))
+
+    def dispatch(self, tool_calls):
+        """
+        Runs the tool calls concurrently and returns one tool message per tool call, in the same order.
+        A call that fails or runs out of time gets an error result instead of holding up the others.
+        """
+        calls = [_tool_call_parts(tool_call) for tool_call in tool_calls]
+        # Each call runs in a copy of the caller's context, so its spans are children of the caller's
+        futures = [self.executor.submit(contextvars.copy_context().run, self._call, name, arguments)
+                   for _, name, arguments in calls]
+        deadline = time.monotonic() + self.timeout
+        messages = []
+        for (tool_call_id, name, _), future in zip(calls, futures):
+            try:
+                result = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeout:
+                future.cancel()
+                result = {"error": f"{name} timed out after {self.timeout}s"}
+            messages.append({"role": "tool", "content": json.dumps(result), "tool_call_id": tool_call_id})
+        return messages
+
+    async def adispatch(self, tool_calls):
+        """
+        Like dispatch, for async handlers: the event loop is free while the tools run on the executor,
+        and calls waiting for an identical call in progress don't take a thread from it.
+        """
+        loop = asyncio.get_running_loop()
+        calls = [_tool_call_parts(tool_call) for tool_call in tool_calls]
+
+        async def run(tool_call_id, name, arguments):
+            if self.flights is None:
+                call = loop.run_in_executor(self.executor, contextvars.copy_context().run, self._run, name, arguments)
+            else:
+                call = self.flights.ado(_flight_key(name, arguments), lambda: self._run(name, arguments), self.executor)
+            try:
+                result = await asyncio.wait_for(call, self.timeout)
+            except asyncio.TimeoutError:
+                result = {"error": f"{name} timed out after {self.timeout}s"}
+            return {"role": "tool", "content": json.dumps(result), "tool_call_id": tool_call_id}
+
+        return list(await asyncio.gather(*(run(*call) for call in calls)))
@@ -0,0 +1,118 @@
+# imports
+import time
+import threading
+import contextvars
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+from httpSession import conditional_get, remember
+from htmlExtractor import read_body, encoding_from_content_type, CHUNK_SIZE
+from parserPool import parse_body
+from telemetry import span
+from crawlCache import normalize_url
+from singleFlight import SingleFlight
+
+# Some websites need you to use proper headers when fetching them:
+headers = {
+ "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
+}
+
+# Crawl limits used by fetch_websites
+MAX_WORKERS = 8        # sub-pages fetched at the same time, across all hosts and crawls
+MAX_PER_HOST = 4       # sub-pages fetched at the same time from one host
+PAGE_TIMEOUT = 10      # seconds allowed for a single page
+CRAWL_BUDGET = 30      # seconds allowed for the whole crawl
+
+class Website:
+    """
+    A utility class to represent a Website that we have scraped, now with links
+    """
+
+    def __init__(self, url, timeout=None):
+        self.url = url
+        deadline = time.monotonic() + timeout if timeout else None
+        with span("scrape", url=url) as scrape:
+            response, page = conditional_get(url, headers=headers, timeout=timeout, stream=True)
+            scrape.set(status=response.status_code)
+            with response:
+                if page is None:
+                    encoding = encoding_from_content_type(response.headers.get("Content-Type"))
+                    body = read_body(response.iter_content(CHUNK_SIZE))
+                    with span("parse", bytes=len(body)):
+                        page = parse_body(body, encoding, timeout=deadline and deadline - time.monotonic())
+                    remember(url, response, page)
+        self.title, self.text, self.links = page["title"], page["text"], page["links"]
+
+    def get_contents(self):
+        return f"Webpage Title:\n{self.title}\nWebpage Contents:\n{self.text}\n\n"
+
+# Scrapes in progress, by normalized url
+scrapes = SingleFlight("scrape")
+
+def fetch_website(url, timeout=None):
+    """
+    Scrapes url into a Website; while a scrape of the same normalized url is in progress, e.g. for
+    another conversation, waits for that one instead of fetching the page again.
+    """
+    return scrapes.do(normalize_url(url), lambda: Website(url, timeout=timeout))
+
+# One entry per requested url; exactly one of website / error is set
+FetchResult = namedtuple("FetchResult", ["url", "website", "error"])
+
+_host_locks = {}
+_host_locks_guard = threading.Lock()
+
+def _host_semaphore(url, max_per_host):
+    host = urlparse(url).netloc.lower()
+    with _host_locks_guard:
+        key = (host, max_per_host)
+        if key not in _host_locks:
+            _host_locks[key] = threading.BoundedSemaphore(max_per_host)
+        return _host_locks[key]
+
+# Shared by every crawl, so concurrent conversations together fetch at most MAX_WORKERS pages at once
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="fetch")
+
+def _fetch_one(url, max_per_host, timeout, deadline):
+    semaphore = _host_semaphore(url, max_per_host)
+    if not semaphore.acquire(timeout=max(deadline - time.monotonic(), 0)):
+        raise TimeoutError("crawl time budget exhausted before fetch started")
+    try:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("crawl time budget exhausted before fetch started")
+        return fetch_website(url, timeout=min(timeout, remaining))
+    finally:
+        semaphore.release()
+
+def fetch_websites(urls, max_per_host=MAX_PER_HOST, timeout=PAGE_TIMEOUT, budget=CRAWL_BUDGET):
+    """
+    Fetches several pages in parallel and returns a FetchResult for each url, in the order given.
+    At most MAX_WORKERS pages are fetched at the same time, across all crawls.
+
+    Args:
+        urls (list): The URLs of the pages to fetch.
+        max_per_host (int): How many pages may be fetched at the same time from one host.
+        timeout (float): Seconds allowed for each page.
+        budget (float): Seconds allowed for the whole crawl; pages not done by then are reported as timed out.
+
+    Returns:
+        list: FetchResult(url, website, error) tuples. A failed page has website=None and the exception in error.
+    """
+    if not urls:
+        return []
+    deadline = time.monotonic() + budget
+    futures = [_executor.submit(contextvars.copy_context().run, _fetch_one, url, max_per_host, timeout, deadline)
+               for url in urls]
+    wait(futures, timeout=max(deadline - time.monotonic(), 0))
+    results = []
+    for url, future in zip(urls, futures):
+        if not future.done():
+            # Still queued behind other crawls' pages, or still downloading
+            future.cancel()
+            results.append(FetchResult(url, None, TimeoutError(f"crawl time budget of {budget}s exceeded")))
+        elif future.exception() is not None:
+            results.append(FetchResult(url, None, future.exception()))
+        else:
+            results.append(FetchResult(url, future.result(), None))
+    return results